@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Date, DECIMAL, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, Date, DECIMAL, Boolean, JSON, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -23,6 +23,7 @@ class AccountData(Base):
 
 class TransactionData(Base):
     __tablename__ = 'transaction_data'
+    __table_args__ = (Index('ix_transaction_data_account_number_value_date', 'account_number', 'value_date'),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     account_number = Column(String(50), ForeignKey('account_data.account_number'))
     transaction_id = Column(String(50))
@@ -0,0 +1,319 @@
+import ast
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from typing import Any, List, Optional
+
+import numpy as np
+
+from accounts.metadata import AccountType, TransactionType, TransactionOperation, ScheduledTransactionTiming, \
+    RateType, compile_expression
+from accounts.runtime import Account, AccountValuation, ExternalTransaction, PropertyValue, Transaction, \
+    TransactionLog, TransactionStorage
+
+
+def _is_vectorizable(expression: str, names: dict[str, set[str]]) -> bool:
+    # expressions built from account positions and properties, rate lookups, Decimal constants and arithmetic,
+    # names are the attributes that can be read of account, accountType and transaction
+    def check(node: ast.AST) -> bool:
+        if isinstance(node, ast.Constant):
+            return isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+        if isinstance(node, ast.BinOp):
+            return isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)) and check(node.left) and \
+                check(node.right)
+        if isinstance(node, ast.UnaryOp):
+            return isinstance(node.op, (ast.USub, ast.UAdd)) and check(node.operand)
+        if isinstance(node, ast.Attribute):
+            return is_name(node.value, "account") and node.attr in names["account"] or \
+                is_name(node.value, "transaction") and node.attr in names["transaction"]
+        if isinstance(node, ast.Subscript):
+            return isinstance(node.value, ast.Attribute) and is_name(node.value.value, "account") and \
+                node.value.attr in names["value_dated"] and is_name(node.slice, "value_date")
+        if isinstance(node, ast.Call) and not node.keywords:
+            if is_name(node.func, "Decimal"):
+                return len(node.args) == 1 and isinstance(node.args[0], ast.Constant) and \
+                    isinstance(node.args[0].value, (int, str))
+            if isinstance(node.func, ast.Attribute) and node.func.attr == "get_rate":
+                rate_type = node.func.value
+                return isinstance(rate_type, ast.Attribute) and is_name(rate_type.value, "accountType") and \
+                    rate_type.attr in names["accountType"] and len(node.args) == 2 and \
+                    is_name(node.args[0], "value_date") and check(node.args[1])
+        return False
+
+    def is_name(node: ast.AST, name: str) -> bool:
+        return isinstance(node, ast.Name) and node.id == name
+
+    try:
+        return check(ast.parse(expression, mode='eval').body)
+    except SyntaxError:
+        return False
+
+
+class _PropertyColumn:
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    def __getitem__(self, value_date: date) -> np.ndarray:
+        return _to_array([value[value_date] for value in self.values])
+
+
+class _RateColumn:
+    def __init__(self, rate_type: RateType):
+        self.rate_type = rate_type
+
+    def get_rate(self, value_date: date, amounts: Any) -> Any:
+        return np.frompyfunc(partial(self.rate_type.get_rate, value_date), 1, 1)(amounts)
+
+
+class _AccountTypeColumns:
+    def __init__(self, account_type: AccountType):
+        self.account_type = account_type
+
+    def __getattr__(self, name: str) -> _RateColumn:
+        return _RateColumn(self.account_type.get_rate_type(name))
+
+
+class _TransactionColumns:
+    def __init__(self, amounts: np.ndarray):
+        self.amount = amounts
+
+
+class _AccountGroup:
+    # accounts with the same start date, schedules and kinds of properties, valued together
+    def __init__(self, accounts: List[Account], external_transactions: List[dict[date, List[ExternalTransaction]]]):
+        self.accounts = accounts
+        self.start_date = accounts[0].start_date
+        self.schedules = accounts[0].schedules
+        self.positions = {name: _to_array([account.positions[name].amount for account in accounts])
+                          for name in accounts[0].positions.keys()}
+        self.properties = {name: _to_array([account.properties[name] for account in accounts])
+                           for name in accounts[0].properties.keys()}
+
+        # amounts of the instalments on the instalment schedule, and instalments set on accounts by value date
+        self.instalment_amounts = _to_array([account.instalment_amount for account in accounts])
+        self.instalments: dict[date, list[tuple[int, Decimal]]] = {}
+        for index, account in enumerate(accounts):
+            for value_date, instalment in account.instalments.items():
+                self.instalments.setdefault(value_date, []).append((index, instalment.amount))
+
+        # external transactions by value date in order of the accounts
+        self.external_transactions: dict[date, list[tuple[int, ExternalTransaction]]] = {}
+        for index, transactions in enumerate(external_transactions):
+            for value_date, values in transactions.items():
+                self.external_transactions.setdefault(value_date, []).extend((index, t) for t in values)
+
+    def get_names(self, account_type: AccountType) -> dict[str, set[str]]:
+        plain = {name for name, values in self.properties.items()
+                 if not any(isinstance(value, PropertyValue) for value in values)}
+        value_dated = {name for name, values in self.properties.items()
+                       if all(isinstance(value, PropertyValue) for value in values)}
+
+        return {"account": set(self.positions.keys()) | (plain - set(Account.model_fields.keys())),
+                "value_dated": value_dated - set(Account.model_fields.keys()),
+                "accountType": set(account_type.rate_types.keys()),
+                "transaction": {"amount"}}
+
+    def close(self):
+        for name, amounts in self.positions.items():
+            for account, amount in zip(self.accounts, amounts):
+                account.positions[name].amount = amount
+
+
+class _AccountColumns:
+    # attributes of the accounts at index of a group as arrays, in place of account in expressions
+    def __init__(self, group: _AccountGroup, index: np.ndarray):
+        self.group = group
+        self.index = index
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self.group.positions:
+            return self.group.positions[name][self.index]
+
+        values = self.group.properties[name][self.index]
+
+        if len(values) and isinstance(values[0], PropertyValue):
+            return _PropertyColumn(values)
+        return values
+
+
+def _to_array(values: list) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class BatchValuation:
+    # forecasts accounts of one account type together, positions of accounts that share start date and schedules
+    # are held in arrays and each amount expression is evaluated once for all of them. Accounts whose expressions
+    # can not be evaluated over arrays are forecast one by one by AccountValuation, with the same results
+    def __init__(self, account_type: AccountType, action_date: date,
+                 transaction_storage: TransactionStorage = TransactionStorage.MODELS):
+        self.account_type = account_type
+        self.action_date = action_date
+        self.transaction_storage = transaction_storage
+        self.batched_accounts = 0
+        self.scalar_accounts = 0
+
+    def forecast(self, to_value_date: date, accounts: List[Account],
+                 external_transactions: Optional[List[dict[date, List[ExternalTransaction]]]] = None):
+        external_transactions = external_transactions or [{} for _ in accounts]
+
+        groups: dict[Any, list[int]] = {}
+        for index, account in enumerate(accounts):
+            groups.setdefault(self.__get_group_key(account), []).append(index)
+
+        for indexes in groups.values():
+            group = _AccountGroup([accounts[i] for i in indexes], [external_transactions[i] for i in indexes])
+
+            if len(indexes) > 1 and self.__is_vectorizable(group):
+                if self.transaction_storage == TransactionStorage.COLUMNAR:
+                    for account in group.accounts:
+                        if account.transaction_log is None:
+                            account.transaction_log = TransactionLog()
+
+                self.__forecast_group(group, to_value_date)
+                group.close()
+                self.batched_accounts += len(indexes)
+                continue
+
+            for i in indexes:
+                AccountValuation(account=accounts[i], account_type=self.account_type, action_date=self.action_date,
+                                 transaction_storage=self.transaction_storage) \
+                    .forecast(to_value_date, external_transactions[i])
+            self.scalar_accounts += len(indexes)
+
+    @staticmethod
+    def __get_group_key(account: Account) -> Any:
+        schedules = tuple((name, schedule.model_dump_json()) for name, schedule in sorted(account.schedules.items()))
+        properties = tuple((name, isinstance(value, PropertyValue))
+                           for name, value in sorted(account.properties.items()))
+        return account.start_date, schedules, properties, tuple(account.positions.keys())
+
+    def __is_vectorizable(self, group: _AccountGroup) -> bool:
+        names = group.get_names(self.account_type)
+        expressions = [t.amount_expression for t in self.account_type.scheduled_transactions] + \
+                      [t.amount_expression for t in self.account_type.triggered_transactions]
+
+        return all(_is_vectorizable(expression, names) for expression in expressions)
+
+    def __forecast_group(self, group: _AccountGroup, to_value_date: date):
+        # the same days and order of transactions as the daily loop of AccountValuation
+        value_date = group.start_date
+
+        self.__start_of_day(group, value_date)
+        self.__process_external_transactions(group, value_date)
+
+        while value_date < to_value_date:
+            self.__end_of_day(group, value_date)
+
+            value_date = value_date + timedelta(days=1)
+
+            self.__start_of_day(group, value_date)
+            self.__process_external_transactions(group, value_date)
+
+    def __start_of_day(self, group: _AccountGroup, value_date: date):
+        self.__create_scheduled_transactions(group, value_date, ScheduledTransactionTiming.START_OF_DAY)
+
+        instalment_type = self.account_type.instalment_type
+
+        if instalment_type and instalment_type.timing == ScheduledTransactionTiming.START_OF_DAY:
+            instalments = group.instalments.get(value_date, [])
+
+            # the accounts of a group share their start date and schedules
+            if group.accounts[0].is_instalment_scheduled(instalment_type.schedule_name, value_date):
+                index = np.arange(len(group.accounts), dtype=np.intp)
+                amounts = group.instalment_amounts.copy()
+                for i, amount in instalments:
+                    amounts[i] = amount
+            else:
+                index = np.array([i for i, _ in instalments], dtype=np.intp)
+                amounts = _to_array([amount for _, amount in instalments])
+
+            if len(index) > 0:
+                transaction_type = self.account_type.get_transaction_type(instalment_type.transaction_type)
+                self.__create_transactions(group, index, transaction_type, value_date, amounts, True)
+
+    def __end_of_day(self, group: _AccountGroup, value_date: date):
+        self.__create_scheduled_transactions(group, value_date, ScheduledTransactionTiming.END_OF_DAY)
+
+    def __process_external_transactions(self, group: _AccountGroup, value_date: date):
+        for index, external_transaction in group.external_transactions.get(value_date, []):
+            transaction_type = self.account_type.get_transaction_type(external_transaction.transaction_type_name)
+            self.__create_transactions(group, np.array([index], dtype=np.intp), transaction_type, value_date,
+                                       _to_array([external_transaction.amount]), False)
+
+    def __create_scheduled_transactions(self, group: _AccountGroup, value_date: date,
+                                        timing: ScheduledTransactionTiming):
+        index = np.arange(len(group.accounts), dtype=np.intp)
+
+        for scheduled_transaction in self.account_type.scheduled_transactions:
+            if scheduled_transaction.timing != timing or \
+                    not group.schedules[scheduled_transaction.schedule_name].is_due(value_date):
+                continue
+
+            transaction_type = self.account_type.get_transaction_type(scheduled_transaction.generated_transaction_type)
+
+            try:
+                amounts = self.__evaluate(group, index, scheduled_transaction.amount_expression, value_date)
+
+                if not transaction_type.maximum_precision:
+                    amounts = _to_array([Decimal(round(amount, 2)) for amount in amounts])
+            except Exception as e:
+                raise Exception(
+                    f'Error calculating {transaction_type.name} on {value_date} expression : '
+                    f'{scheduled_transaction.amount_expression} {e.args}') from e
+
+            posted = np.array([amount != Decimal(0) for amount in amounts], dtype=bool)
+
+            if posted.any():
+                self.__create_transactions(group, index[posted], transaction_type, value_date, amounts[posted], True)
+
+    def __create_transactions(self, group: _AccountGroup, index: np.ndarray, transaction_type: TransactionType,
+                              value_date: date, amounts: np.ndarray, system_generated: bool):
+        for rule in transaction_type.position_rules:
+            column = group.positions[rule.position_type_name]
+            if rule.operation == TransactionOperation.CREDIT:
+                column[index] = column[index] + amounts
+            elif rule.operation == TransactionOperation.DEBIT:
+                column[index] = column[index] - amounts
+            else:
+                column[index] = amounts
+
+        if self.transaction_storage == TransactionStorage.COLUMNAR:
+            for i, amount in zip(index, amounts):
+                group.accounts[i].transaction_log.append(self.action_date, value_date, transaction_type.name, amount,
+                                                         system_generated)
+        else:
+            transactions = [Transaction(action_date=self.action_date, value_date=value_date,
+                                        transaction_type=transaction_type.name, amount=amount,
+                                        system_generated=system_generated) for amount in amounts]
+
+            for i, transaction in zip(index, transactions):
+                group.accounts[i].transactions.append(transaction)
+
+            # triggers read the validated amounts, as they do in AccountValuation
+            amounts = _to_array([transaction.amount for transaction in transactions])
+
+        triggered_transaction = self.account_type.get_trigger_transaction(transaction_type.name)
+
+        if triggered_transaction:
+            trigger_amounts = self.__evaluate(group, index, triggered_transaction.amount_expression, value_date,
+                                              amounts)
+
+            generated_transaction_type = self.account_type.get_transaction_type(
+                triggered_transaction.generated_transaction_type)
+            self.__create_transactions(group, index, generated_transaction_type, value_date, trigger_amounts, True)
+
+    def __evaluate(self, group: _AccountGroup, index: np.ndarray, expression: str, value_date: date,
+                   transaction_amounts: Optional[np.ndarray] = None) -> np.ndarray:
+        amounts = eval(compile_expression(expression), None,
+                       {"accountType": _AccountTypeColumns(self.account_type),
+                        "account": _AccountColumns(group, index),
+                        "transaction": _TransactionColumns(transaction_amounts),
+                        "value_date": value_date})
+
+        if not isinstance(amounts, np.ndarray):
+            # expression of constants only
+            return _to_array([amounts] * len(index))
+
+        return amounts
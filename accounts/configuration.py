@@ -1,3 +1,8 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Callable, Any
+from weakref import WeakKeyDictionary
 from pydantic import BaseModel
 from sqlalchemy import Column, String, Integer, JSON
 from sqlalchemy.ext.declarative import declarative_base
@@ -15,6 +20,69 @@ class Configuration(BaseModel):
 class TenantConfiguration(Configuration):
     tenant_name: str
 
+class ConfigurationCache:
+    # parsed configurations by (tenant_name, name, version), least recently used dropped after max_size,
+    # and the latest version of each (tenant_name, name) for ttl seconds
+    def __init__(self, max_size: int = 128, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._configurations: OrderedDict[tuple[str, str, int], Configuration] = OrderedDict()
+        self._latest: dict[tuple[str, str], tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_name: str, name: str, version: int) -> Optional[Configuration]:
+        with self._lock:
+            return self.__get(tenant_name, name, version)
+
+    def get_latest(self, tenant_name: str, name: str) -> Optional[Configuration]:
+        with self._lock:
+            latest = self._latest.get((tenant_name, name))
+            configuration = None
+
+            if latest is not None and latest[1] > self.clock():
+                configuration = self.__get(tenant_name, name, latest[0])
+
+            if configuration is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            return configuration
+
+    def put(self, tenant_name: str, name: str, version: int, configuration: Configuration, latest: bool = False):
+        with self._lock:
+            key = (tenant_name, name, version)
+            self._configurations[key] = configuration
+            self._configurations.move_to_end(key)
+
+            while len(self._configurations) > self.max_size:
+                self._configurations.popitem(last=False)
+
+            if latest:
+                self._latest[(tenant_name, name)] = (version, self.clock() + self.ttl)
+
+    def invalidate_latest(self, tenant_name: str, name: str):
+        with self._lock:
+            self._latest.pop((tenant_name, name), None)
+
+    def clear(self):
+        with self._lock:
+            self._configurations.clear()
+            self._latest.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __get(self, tenant_name: str, name: str, version: int) -> Optional[Configuration]:
+        configuration = self._configurations.get((tenant_name, name, version))
+
+        if configuration is not None:
+            self._configurations.move_to_end((tenant_name, name, version))
+
+        return configuration
+
 class ConfigurationData(Base):
     __tablename__ = 'configuration'
     name = Column(String(50), primary_key=True)
@@ -50,4 +118,19 @@ class ConfigurationData(Base):
 
     @staticmethod
     def deserialize_account_types(data: list[dict]) -> list[AccountType]:
-        return [AccountType(**item) for item in data]
\ No newline at end of file
+        return [AccountType(**item) for item in data]
+
+
+# one cache per database engine, so repositories bound to different databases never share configurations
+_engine_caches: WeakKeyDictionary = WeakKeyDictionary()
+_engine_caches_lock = threading.Lock()
+
+
+def get_configuration_cache(engine: Any) -> ConfigurationCache:
+    with _engine_caches_lock:
+        cache = _engine_caches.get(engine)
+
+        if cache is None:
+            cache = _engine_caches[engine] = ConfigurationCache()
+
+        return cache
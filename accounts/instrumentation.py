@@ -0,0 +1,84 @@
+from enum import Enum
+from time import perf_counter
+from typing import Iterable
+
+
+class ValuationPhase(Enum):
+    FORECAST = "forecast"
+    SCHEDULE_DUE_CHECK = "schedule_due_check"
+    EXPRESSION = "expression"
+    TRIGGER = "trigger"
+    POSITION_UPDATE = "position_update"
+    INSTALMENT_SOLVER = "instalment_solver"
+
+
+class Instrumentation:
+    # records nothing, valuations only take times when enabled is set
+    enabled = False
+
+    def record(self, phase: ValuationPhase, name: str, start: float):
+        pass
+
+
+class PhaseStatistics:
+    __slots__ = ("phase", "name", "count", "total", "max")
+
+    def __init__(self, phase: ValuationPhase, name: str):
+        self.phase = phase
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, count: int, total: float, maximum: float):
+        self.count += count
+        self.total += total
+        self.max = max(self.max, maximum)
+
+    def to_dict(self) -> dict:
+        return {"phase": self.phase.value, "name": self.name, "count": self.count, "total": self.total,
+                "max": self.max}
+
+
+class ProfilingInstrumentation(Instrumentation):
+    # count and time (including nested phases) of every phase and name, e.g. an expression or transaction type,
+    # share one instance between valuations to aggregate over many accounts
+    enabled = True
+
+    def __init__(self):
+        self.statistics: dict[tuple[ValuationPhase, str], PhaseStatistics] = {}
+
+    def record(self, phase: ValuationPhase, name: str, start: float):
+        elapsed = perf_counter() - start
+        statistics = self.statistics.get((phase, name))
+
+        if statistics is None:
+            statistics = self.statistics[(phase, name)] = PhaseStatistics(phase, name)
+
+        statistics.count += 1
+        statistics.total += elapsed
+        if elapsed > statistics.max:
+            statistics.max = elapsed
+
+    def merge(self, others: Iterable['ProfilingInstrumentation']) -> 'ProfilingInstrumentation':
+        # e.g. instrumentation returned by worker processes
+        for other in others:
+            for key, statistics in other.statistics.items():
+                if key not in self.statistics:
+                    self.statistics[key] = PhaseStatistics(*key)
+                self.statistics[key].add(statistics.count, statistics.total, statistics.max)
+
+        return self
+
+    def report(self) -> list[PhaseStatistics]:
+        return sorted(self.statistics.values(), key=lambda statistics: statistics.total, reverse=True)
+
+    def __str__(self):
+        lines = [f"{'phase':20} {'count':>10} {'total ms':>12} {'max ms':>10}  name"]
+        lines.extend(f"{s.phase.value:20} {s.count:10} {s.total * 1000:12.1f} {s.max * 1000:10.3f}  {s.name}"
+                     for s in self.report())
+        return "\n".join(lines)
+
+
+# default of valuations
+no_instrumentation = Instrumentation()
@@ -1,11 +1,23 @@
+from bisect import bisect_left, bisect_right
 from calendar import monthrange
 from datetime import date
 from decimal import Decimal
 from enum import Enum
+from functools import lru_cache
+from types import CodeType
 from typing import List, Optional, Dict
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
-from accounts.utility import CustomEncoder
+from accounts.utility import CustomEncoder, DerivedState
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> CodeType:
+    # expressions are shared by every account of a type, so each source string is parsed only once per process
+    try:
+        return compile(expression, '<expression>', 'eval')
+    except SyntaxError as e:
+        raise ValueError(f'Error compiling expression: {expression} {e.args}') from e
 
 
 class TransactionOperation(Enum):
@@ -64,6 +76,8 @@ class RateType(BaseModel):
     name: str
     label: str
     rate_tiers: Dict[str, List[RateTier]] = {}
+    # sorted effective dates and, for each of them, (tiers, applicable tiers, their to_amount boundaries)
+    _lookups: DerivedState = PrivateAttr(default_factory=DerivedState)
 
     class Config:
         json_encoders = {Dict: CustomEncoder()}
@@ -79,6 +93,7 @@ class RateType(BaseModel):
 
         rate_tier = RateTier(from_amount=self.get_max_to_amount(value_date), to_amount=to_amount, rate=rate)
         self.rate_tiers[key].append(rate_tier)
+        self._lookups.effective_dates = None
 
     def get_max_to_amount(self, value_date: date):
         key = self.__get_key(value_date)
@@ -93,20 +108,42 @@ class RateType(BaseModel):
         max_value = max(rate_tiers, key=lambda tier: tier.to_amount)
         return max_value.to_amount
 
-    def __get_tiers(self, value_date) -> List[RateTier]:
-        # find first date that is less than or equal to value_date
-        key = self.__get_key(value_date)
-        dates = [d for d in self.rate_tiers.keys() if d <= key]
-        if len(dates) == 0:
+    @staticmethod
+    def __index_tiers(rate_tiers: List[RateTier]) -> tuple[List[RateTier], List[RateTier], Optional[List[Decimal]]]:
+        applicable = [rt for rt in rate_tiers if rt.from_amount <= rt.to_amount]
+
+        # tiers created by add_tier follow each other, anything else is searched in order of the tiers
+        if any(previous.to_amount > rt.from_amount for previous, rt in zip(applicable, applicable[1:])):
+            return rate_tiers, applicable, None
+
+        return rate_tiers, applicable, [rt.to_amount for rt in applicable]
+
+    def __get_tiers(self, value_date) -> tuple[List[RateTier], List[RateTier], Optional[List[Decimal]]]:
+        # pydantic resolves private attributes in __getattr__, which is slow for lookups made every day
+        lookups = self.__pydantic_private__["_lookups"]
+
+        if lookups.effective_dates is None:
+            keys = sorted(self.rate_tiers.keys())
+            lookups.effective_tiers = [self.__index_tiers(self.rate_tiers[key]) for key in keys]
+            lookups.effective_dates = [date.fromisoformat(key) for key in keys]
+
+        # find last date that is less than or equal to value_date
+        index = bisect_right(lookups.effective_dates, value_date) - 1
+        if index < 0:
             raise Exception(f"No rate tiers found for date {str(value_date)} in rate table {self.name}")
-        index_date = max(dates)
-        return self.rate_tiers[index_date]
+        return lookups.effective_tiers[index]
 
     def get_rate(self, value_date: date, amount: Decimal) -> Decimal:
-        applicable_tiers = (rt for rt in self.__get_tiers(value_date) if rt.from_amount <= amount <= rt.to_amount)
+        rate_tiers, applicable, to_amounts = self.__get_tiers(value_date)
+
+        if to_amounts is None:
+            rate_tier = next((rt for rt in rate_tiers if rt.from_amount <= amount <= rt.to_amount), None)
+        else:
+            index = bisect_left(to_amounts, amount)
+            rate_tier = applicable[index] \
+                if index < len(applicable) and applicable[index].from_amount <= amount else None
 
         # if no tiers are applicable, raise an exception
-        rate_tier = next(applicable_tiers, None)
         if rate_tier is None:
             if amount < Decimal(0):
                 return Decimal(0)
@@ -127,7 +164,9 @@ class RateType(BaseModel):
 
         exit_loop = False
 
-        for rate_tier in self.__get_tiers(value_date):
+        rate_tiers, _, _ = self.__get_tiers(value_date)
+
+        for rate_tier in rate_tiers:
             if rate_tier.from_amount <= processed < rate_tier.to_amount:
                 part_processed = rate_tier.to_amount - processed
 
@@ -173,6 +212,17 @@ class ScheduleType(BaseModel):
     include_dates_expression: Optional[str] = None
     exclude_dates_expression: Optional[str] = None
     editable: bool = True
+    # registered calendar used for business_day_adjustment, the default calendar when not set
+    calendar_name: Optional[str] = None
+
+    def get_expressions(self) -> List[str]:
+        return [expression for expression in (self.interval_expression,
+                                              self.start_date_expression,
+                                              self.end_date_expression,
+                                              self.number_of_repeats_expression,
+                                              self.include_dates_expression,
+                                              self.exclude_dates_expression)
+                if expression]
 
 
 class ScheduledTransaction(BaseModel):
@@ -219,6 +269,25 @@ class AccountType(BaseModel):
     property_types: List[PropertyType] = []
     scheduled_transactions: List[ScheduledTransaction] = []
     instalment_type: InstalmentType = None
+    # transaction_types, triggered_transactions and schedule_types maps by name
+    _lookups: DerivedState = PrivateAttr(default_factory=DerivedState)
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.compile_expressions()
+
+    def get_expressions(self) -> List[str]:
+        expressions = [st.amount_expression for st in self.scheduled_transactions]
+        expressions.extend(tt.amount_expression for tt in self.triggered_transactions)
+
+        for schedule_type in self.schedule_types:
+            expressions.extend(schedule_type.get_expressions())
+
+        return expressions
+
+    def compile_expressions(self) -> Dict[str, CodeType]:
+        # raises ValueError for the first expression that is not valid python
+        return {expression: compile_expression(expression) for expression in self.get_expressions()}
 
     def add_property_type(self, name: str, label: str, data_type: DataType, required: bool = True) -> PropertyType:
         property_type = PropertyType(name=name, label=label, data_type=data_type.value, required=required)
@@ -233,6 +302,7 @@ class AccountType(BaseModel):
     def add_transaction_type(self, name: str, label: str, maximum_precision: bool = False) -> TransactionType:
         transaction_type = TransactionType(name=name, label=label, maximum_precision=maximum_precision)
         self.transaction_types.append(transaction_type)
+        self._lookups.transaction_types = None
         return transaction_type
 
     def add_position_type(self, name: str, label: str) -> PositionType:
@@ -247,30 +317,70 @@ class AccountType(BaseModel):
 
     def add_trigger_transaction(self, trigger_transaction_type: TransactionType,
                                 generated_transaction_type: TransactionType, amount_expression: str):
+        compile_expression(amount_expression)
         trigger_transaction = TriggeredTransaction(trigger_transaction_type_name=trigger_transaction_type.name,
                                                    generated_transaction_type=generated_transaction_type.name,
                                                    amount_expression=amount_expression)
         self.triggered_transactions.append(trigger_transaction)
+        self._lookups.triggered_transactions = None
 
     def add_schedule_type(self, schedule_type: ScheduleType):
+        for expression in schedule_type.get_expressions():
+            compile_expression(expression)
+
         self.schedule_types.append(schedule_type)
+        self._lookups.schedule_types = None
 
     def add_scheduled_transaction(self, schedule_type: ScheduleType, timing: ScheduledTransactionTiming,
                                   generated_transaction_type: TransactionType, amount_expression: str):
+        compile_expression(amount_expression)
         scheduled_transaction = ScheduledTransaction(schedule_name=schedule_type.name, timing=timing,
                                                      generated_transaction_type=generated_transaction_type.name,
                                                      amount_expression=amount_expression)
         self.scheduled_transactions.append(scheduled_transaction)
 
+    def __get_lookups(self) -> DerivedState:
+        # pydantic resolves private attributes in __getattr__, which is slow for lookups made on every posting
+        return self.__pydantic_private__["_lookups"]
+
+    def __transaction_types_map(self) -> Dict[str, TransactionType]:
+        lookups = self.__get_lookups()
+        if lookups.transaction_types is None:
+            lookups.transaction_types = {}
+            for tt in self.transaction_types:
+                lookups.transaction_types.setdefault(tt.name, tt)
+
+        return lookups.transaction_types
+
+    def __triggered_transactions_map(self) -> Dict[str, TriggeredTransaction]:
+        lookups = self.__get_lookups()
+        if lookups.triggered_transactions is None:
+            lookups.triggered_transactions = {}
+            for tt in self.triggered_transactions:
+                lookups.triggered_transactions.setdefault(tt.trigger_transaction_type_name, tt)
+
+        return lookups.triggered_transactions
+
+    def __schedule_types_map(self) -> Dict[str, ScheduleType]:
+        lookups = self.__get_lookups()
+        if lookups.schedule_types is None:
+            lookups.schedule_types = {}
+            for st in self.schedule_types:
+                lookups.schedule_types.setdefault(st.name, st)
+
+        return lookups.schedule_types
+
     def get_transaction_type(self, transaction_type_name: str) -> TransactionType:
-        return next(tt for tt in self.transaction_types if tt.name == transaction_type_name)
+        return self.__transaction_types_map()[transaction_type_name]
+
+    def get_schedule_type(self, schedule_type_name: str) -> ScheduleType:
+        return self.__schedule_types_map()[schedule_type_name]
 
     def get_rate_type(self, rate_type_name: str):
-        return next(rt for rt in self.rate_types if rt.name == rate_type_name)
+        return self.rate_types[rate_type_name]
 
     def get_trigger_transaction(self, trigger_transaction_type_name: str) -> Optional[TriggeredTransaction]:
-        return next((tt for tt in self.triggered_transactions if
-                     tt.trigger_transaction_type_name == trigger_transaction_type_name), None)
+        return self.__triggered_transactions_map().get(trigger_transaction_type_name)
 
     def add_instalment_type(self, name: str, label: str, timing: ScheduledTransactionTiming,
                             transaction_type: str, property_name: str,
@@ -286,7 +396,10 @@ class AccountType(BaseModel):
         self.instalment_type = instalment_type
 
     def __getattr__(self, method_name):
-        if method_name in self.rate_types:
+        if method_name.startswith("_"):
+            # private attributes
+            return super().__getattr__(method_name)
+        elif method_name in self.rate_types:
             return self.rate_types[method_name]
         else:
             raise AttributeError(f'No such attribute: {method_name}')
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import date
+from itertools import islice
+from multiprocessing.context import BaseContext
+from typing import Iterable, Iterator, List, Optional, Any
+
+from accounts.metadata import AccountType
+from accounts.runtime import Account, AccountValuation, ExternalTransaction, Calendar, calendar_registry
+
+# account type of the worker process, set once by the pool initializer
+_account_type: Optional[AccountType] = None
+
+
+def _initialize_worker(account_type: AccountType, calendars: List[Calendar]):
+    global _account_type
+    _account_type = account_type
+
+    # spawned workers do not inherit the calendars registered in the parent process
+    for calendar in calendars:
+        calendar_registry.register(calendar)
+
+
+def _forecast_chunk(to_value_date: date, action_date: date, options: dict[str, Any],
+                    chunk: List[tuple[int, Account, dict[date, List[ExternalTransaction]]]]) -> List[tuple[int, Account]]:
+    results = []
+
+    for index, account, external_transactions in chunk:
+        valuation = AccountValuation(account=account, account_type=_account_type, action_date=action_date, **options)
+        valuation.forecast(to_value_date, external_transactions)
+        results.append((index, account))
+
+    return results
+
+
+class PortfolioValuation:
+    def __init__(self, account_type: AccountType, action_date: date, max_workers: Optional[int] = None,
+                 chunk_size: int = 100, mp_context: Optional[BaseContext] = None, **options):
+        # options are passed to every AccountValuation, e.g. engine or accrual_aggregation
+        self.account_type = account_type
+        self.action_date = action_date
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.mp_context = mp_context
+        self.options = options
+
+    def forecast(self, to_value_date: date,
+                 accounts: Iterable[tuple[Account, dict[date, List[ExternalTransaction]]]]) -> Iterator[tuple[int, Account]]:
+        # yields (index in accounts, valued account) as chunks complete, so results are not in input order
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context,
+                                 initializer=_initialize_worker,
+                                 initargs=(self.account_type, list(calendar_registry.calendars.values()))) \
+                as executor:
+            pending: set[Future] = set()
+
+            for chunk in self.__get_chunks(accounts):
+                # keep a bounded number of chunks in flight so large portfolios are not loaded at once
+                if len(pending) >= 2 * self.max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+
+                pending.add(executor.submit(_forecast_chunk, to_value_date, self.action_date, self.options, chunk))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+    def __get_chunks(self, accounts: Iterable[tuple[Account, dict[date, List[ExternalTransaction]]]]) \
+            -> Iterator[List[tuple[int, Account, dict[date, List[ExternalTransaction]]]]]:
+        iterator = ((index, account, external_transactions)
+                    for index, (account, external_transactions) in enumerate(accounts))
+
+        while chunk := list(islice(iterator, self.chunk_size)):
+            yield chunk
@@ -1,10 +1,17 @@
+import uuid
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from accounts.configuration import ConfigurationData
+from datetime import date
+from typing import List, Optional, Dict, Iterator
+from accounts.configuration import ConfigurationData, Configuration, ConfigurationCache, \
+    get_configuration_cache
 from accounts.accounts import AccountData, PositionData, TransactionData
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from accounts.session import SessionData
 
 class ConfigurationRepository(ABC):
+    cache: ConfigurationCache
 
     @abstractmethod
     def get_all_configurations(self) -> List[ConfigurationData]:
@@ -18,9 +25,32 @@ class ConfigurationRepository(ABC):
     def save(self, configuration: ConfigurationData) -> ConfigurationData:
         pass
 
+    def get_latest_configuration(self, name: str) -> Optional[Configuration]:
+        # parsed latest configuration, only querying and parsing when it is not cached
+        tenant_name = self._get_tenant_name()
+        configuration = self.cache.get_latest(tenant_name, name)
+
+        if configuration is None:
+            configuration_data = self.get_latest_configuration_by_name(name)
+            if configuration_data is None:
+                return None
+
+            configuration = self.cache.get(tenant_name, name, configuration_data.version) or \
+                configuration_data.from_data()
+            self.cache.put(tenant_name, name, configuration_data.version, configuration, latest=True)
+
+        return configuration
+
+    @staticmethod
+    def _get_tenant_name() -> str:
+        session_info = SessionData.get_session_info()
+        return session_info.get('tenant_name', 'default_tenant') if session_info else 'default_tenant'
+
 class InMemoryConfigurationRepository(ConfigurationRepository):
-    def __init__(self):
+    def __init__(self, cache: Optional[ConfigurationCache] = None):
         self.configurations = []
+        # every in-memory repository is a separate store, so it does not share the process cache
+        self.cache = cache or ConfigurationCache()
 
     def get_all_configurations(self) -> List[ConfigurationData]:
         return self.configurations
@@ -38,13 +68,16 @@ class InMemoryConfigurationRepository(ConfigurationRepository):
         else:
             configuration.version = 1
         self.configurations.append(configuration)
+        self.cache.invalidate_latest(self._get_tenant_name(), configuration.name)
         return configuration
 
 
 
 class SQLAlchemyConfigurationRepository(ConfigurationRepository):
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, cache: Optional[ConfigurationCache] = None):
         self.session = session
+        # shared by the repositories of the same engine, get_bind returns an engine or a connection
+        self.cache = cache or get_configuration_cache(session.get_bind().engine)
 
     def get_all_configurations(self) -> List[ConfigurationData]:
         return self.session.query(ConfigurationData).all()
@@ -60,6 +93,7 @@ class SQLAlchemyConfigurationRepository(ConfigurationRepository):
             configuration.version = 1
         self.session.add(configuration)
         self.session.commit()
+        self.cache.invalidate_latest(self._get_tenant_name(), configuration.name)
         return configuration
 
 class AccountRepository(ABC):
@@ -76,20 +110,32 @@ class AccountRepository(ABC):
     def create_transactions(self, positions: List[PositionData], transactions: List[TransactionData]):
         pass
 
+    @abstractmethod
+    def bulk_create_transactions(self, positions: List[PositionData], transactions: List[TransactionData]):
+        pass
+
     @abstractmethod
     def get_account_data(self, account_number: str) -> dict:
         pass
 
+    @abstractmethod
+    def iter_transactions(self, account_number: str, from_value_date: Optional[date] = None,
+                          to_value_date: Optional[date] = None,
+                          batch_size: Optional[int] = None) -> Iterator[TransactionData]:
+        pass
+
 class InMemoryAccountRepository(AccountRepository):
     def __init__(self):
         self.accounts = {}
-        self.positions = []
-        self.transactions = []
+        # account_number -> position_type -> position and account_number -> transactions
+        self.positions: Dict[str, Dict[str, PositionData]] = {}
+        self.transactions: Dict[str, List[TransactionData]] = {}
 
     def create_account(self, account: AccountData, positions: List[PositionData], transactions: List[TransactionData]):
         self.accounts[account.account_number] = account
-        self.positions.extend(positions)
-        self.transactions.extend(transactions)
+        for position in positions:
+            self.positions.setdefault(position.account_number, {}).setdefault(position.position_type, position)
+        self.__add_transactions(transactions)
 
     def update_account_additional_info(self, account_number: str, additional_info: dict):
         if account_number in self.accounts:
@@ -97,28 +143,45 @@ class InMemoryAccountRepository(AccountRepository):
 
     def create_transactions(self, positions: List[PositionData], transactions: List[TransactionData]):
         for position in positions:
-            existing_position = next((p for p in self.positions if p.account_number == position.account_number and p.position_type == position.position_type), None)
+            account_positions = self.positions.setdefault(position.account_number, {})
+            existing_position = account_positions.get(position.position_type)
             if existing_position:
                 existing_position.amount = position.amount
                 existing_position.additional_info = position.additional_info
             else:
-                self.positions.append(position)
-        self.transactions.extend(transactions)
+                account_positions[position.position_type] = position
+        self.__add_transactions(transactions)
+
+    def __add_transactions(self, transactions: List[TransactionData]):
+        for transaction in transactions:
+            self.transactions.setdefault(transaction.account_number, []).append(transaction)
+
+    def bulk_create_transactions(self, positions: List[PositionData], transactions: List[TransactionData]):
+        self.create_transactions(positions, transactions)
 
     def get_account_data(self, account_number: str) -> dict:
         account = self.accounts.get(account_number)
-        positions = [p for p in self.positions if p.account_number == account_number]
-        transactions = [t for t in self.transactions if t.account_number == account_number]
+        positions = list(self.positions.get(account_number, {}).values())
+        transactions = list(self.transactions.get(account_number, []))
         return {
             "account": account,
             "positions": positions,
             "transactions": transactions
         }
 
+    def iter_transactions(self, account_number: str, from_value_date: Optional[date] = None,
+                          to_value_date: Optional[date] = None,
+                          batch_size: Optional[int] = None) -> Iterator[TransactionData]:
+        transactions = (t for t in self.transactions.get(account_number, [])
+                        if (from_value_date is None or t.value_date >= from_value_date) and
+                        (to_value_date is None or t.value_date <= to_value_date))
+        return iter(sorted(transactions, key=lambda t: (t.value_date is not None, t.value_date)))
+
 
 class SQLAlchemyAccountRepository(AccountRepository):
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, batch_size: int = 1000):
         self.session = session
+        self.batch_size = batch_size
 
     def create_account(self, account: AccountData, positions: List[PositionData], transactions: List[TransactionData]):
         self.session.add(account)
@@ -143,6 +206,67 @@ class SQLAlchemyAccountRepository(AccountRepository):
                     self.session.add(position)
             self.session.add_all(transactions)
 
+    def bulk_create_transactions(self, positions: List[PositionData], transactions: List[TransactionData]):
+        # same result as create_transactions using a few statements per batch instead of statements per row
+        with self.session.begin():
+            self.__upsert_positions(positions)
+
+            rows = [self.__transaction_row(transaction) for transaction in transactions]
+            for start in range(0, len(rows), self.batch_size):
+                self.session.execute(insert(TransactionData.__table__), rows[start:start + self.batch_size])
+
+    def __upsert_positions(self, positions: List[PositionData]):
+        # last position wins when an account position is given more than once
+        rows = list({(p.account_number, p.position_type): {"account_number": p.account_number,
+                                                            "position_type": p.position_type,
+                                                            "amount": p.amount,
+                                                            "additional_info": p.additional_info}
+                     for p in positions}.values())
+
+        if not rows:
+            return
+
+        dialect = self.session.get_bind().dialect.name
+
+        if dialect not in ("postgresql", "sqlite"):
+            self.__merge_positions(rows)
+            return
+
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+        for start in range(0, len(rows), self.batch_size):
+            statement = dialect_insert(PositionData.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=[PositionData.account_number, PositionData.position_type],
+                set_={"amount": statement.excluded.amount, "additional_info": statement.excluded.additional_info})
+            self.session.execute(statement, rows[start:start + self.batch_size])
+
+    def __merge_positions(self, rows: List[dict]):
+        account_numbers = list({row["account_number"] for row in rows})
+        existing_positions = {}
+
+        for start in range(0, len(account_numbers), self.batch_size):
+            for position in self.session.query(PositionData).filter(
+                    PositionData.account_number.in_(account_numbers[start:start + self.batch_size])):
+                existing_positions[(position.account_number, position.position_type)] = position
+
+        for row in rows:
+            existing_position = existing_positions.get((row["account_number"], row["position_type"]))
+            if existing_position:
+                existing_position.amount = row["amount"]
+                existing_position.additional_info = row["additional_info"]
+            else:
+                self.session.add(PositionData(**row))
+
+    @staticmethod
+    def __transaction_row(transaction: TransactionData) -> dict:
+        row = {column.key: getattr(transaction, column.key) for column in TransactionData.__table__.columns}
+
+        if row["id"] is None:
+            row["id"] = uuid.uuid4()
+
+        return row
+
     def get_account_data(self, account_number: str) -> dict:
         account = self.session.query(AccountData).filter_by(account_number=account_number).first()
         positions = self.session.query(PositionData).filter_by(account_number=account_number).all()
@@ -151,4 +275,18 @@ class SQLAlchemyAccountRepository(AccountRepository):
             "account": account,
             "positions": positions,
             "transactions": transactions
-        }
\ No newline at end of file
+        }
+
+    def iter_transactions(self, account_number: str, from_value_date: Optional[date] = None,
+                          to_value_date: Optional[date] = None,
+                          batch_size: Optional[int] = None) -> Iterator[TransactionData]:
+        # streams transactions ordered by value date, loading batch_size rows at a time
+        query = self.session.query(TransactionData).filter(TransactionData.account_number == account_number)
+
+        if from_value_date is not None:
+            query = query.filter(TransactionData.value_date >= from_value_date)
+
+        if to_value_date is not None:
+            query = query.filter(TransactionData.value_date <= to_value_date)
+
+        return iter(query.order_by(TransactionData.value_date).yield_per(batch_size or self.batch_size))
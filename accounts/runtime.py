@@ -1,10 +1,21 @@
+import ast
+import heapq
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import timedelta
-from itertools import groupby
-from typing import Mapping, Any
+from enum import IntEnum
+from itertools import groupby, chain
+from time import perf_counter
+from typing import Mapping, Any, Iterator, Iterable, Callable
 from dateutil.relativedelta import *
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from accounts.metadata import *
+from accounts.instrumentation import ValuationPhase, no_instrumentation
+from accounts.utility import DerivedState
+import numpy as np
 import scipy.optimize
 
 class Position(BaseModel):
@@ -24,6 +35,29 @@ class Position(BaseModel):
         return position
 
 
+class PositionView:
+    # in place of a Position in Account.positions while a valuation is running, reading and writing the plain
+    # amount in Account.position_amounts
+    __slots__ = ("amounts", "name")
+
+    def __init__(self, amounts: dict[str, Decimal], name: str):
+        self.amounts = amounts
+        self.name = name
+
+    @property
+    def amount(self) -> Decimal:
+        return self.amounts[self.name]
+
+    @amount.setter
+    def amount(self, amount: Decimal):
+        self.amounts[self.name] = amount
+
+    apply_operation = Position.apply_operation
+
+    def copy(self) -> Position:
+        return Position(amount=self.amount)
+
+
 class Transaction(BaseModel):
     amount = Decimal(0)
     action_date: date
@@ -40,6 +74,163 @@ class Transaction(BaseModel):
         )
 
 
+class TransactionLog:
+    # columnar store of forecast transactions, Transaction models are only created when read
+    __slots__ = ("action_dates", "value_dates", "type_codes", "amounts", "system_generated", "type_names",
+                 "type_codes_map")
+
+    def __init__(self):
+        self.action_dates = array("i")
+        self.value_dates = array("i")
+        self.type_codes = array("H")
+        self.amounts: list[Decimal] = []
+        self.system_generated = bytearray()
+        self.type_names: list[str] = []
+        self.type_codes_map: dict[str, int] = {}
+
+    def append(self, action_date: date, value_date: date, transaction_type: str, amount: Decimal,
+               system_generated: bool):
+        type_code = self.type_codes_map.get(transaction_type)
+
+        if type_code is None:
+            type_code = self.type_codes_map[transaction_type] = len(self.type_names)
+            self.type_names.append(transaction_type)
+
+        self.action_dates.append(action_date.toordinal())
+        self.value_dates.append(value_date.toordinal())
+        self.type_codes.append(type_code)
+        self.amounts.append(amount)
+        self.system_generated.append(system_generated)
+
+    def truncate(self, count: int) -> list[Transaction]:
+        # returns the transactions removed
+        removed = self[count:]
+
+        del self.action_dates[count:]
+        del self.value_dates[count:]
+        del self.type_codes[count:]
+        del self.amounts[count:]
+        del self.system_generated[count:]
+
+        return removed
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__get_transaction(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('transaction index out of range')
+
+        return self.__get_transaction(index)
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return (self.__get_transaction(i) for i in range(len(self)))
+
+    def __eq__(self, other: Any) -> bool:
+        # type codes depend on the order types were first posted, so types are compared by name
+        if not isinstance(other, TransactionLog):
+            return NotImplemented
+
+        return self.action_dates == other.action_dates and self.value_dates == other.value_dates and \
+            self.amounts == other.amounts and self.system_generated == other.system_generated and \
+            [self.type_names[code] for code in self.type_codes] == \
+            [other.type_names[code] for code in other.type_codes]
+
+    __hash__ = None
+
+    def __get_transaction(self, index: int) -> Transaction:
+        return Transaction.model_construct(action_date=date.fromordinal(self.action_dates[index]),
+                                           value_date=date.fromordinal(self.value_dates[index]),
+                                           transaction_type=self.type_names[self.type_codes[index]],
+                                           amount=self.amounts[index],
+                                           system_generated=bool(self.system_generated[index]))
+
+
+# longest run of non business days a schedule adjustment is expected to skip
+ADJUSTMENT_MARGIN_DAYS = 10
+# instalments are due on the instalment schedule for this many years after the start of an account
+INSTALMENT_YEARS = 50
+
+
+class ScheduleDates:
+    # sorted due dates of a schedule, complete up to horizon, and a bitmap of them starting at first_date
+    __slots__ = ("horizon", "complete", "dates", "first_date", "bitmap")
+
+    def __init__(self, horizon: date, complete: bool, dates: np.ndarray):
+        self.horizon = horizon
+        self.complete = complete
+        self.dates = dates
+        # shared between schedules by schedule_dates_cache
+        self.dates.flags.writeable = False
+
+        if len(dates) == 0:
+            self.first_date = horizon
+            self.bitmap = b""
+        else:
+            self.first_date = dates[0].item()
+            bitmap = np.zeros((dates[-1] - dates[0]).astype(int) + 1, dtype=np.uint8)
+            bitmap[(dates - dates[0]).astype(int)] = 1
+            self.bitmap = bitmap.tobytes()
+
+    def is_due(self, test_date: date) -> bool:
+        offset = (test_date - self.first_date).days
+        return 0 <= offset < len(self.bitmap) and self.bitmap[offset] == 1
+
+
+class ScheduleDatesCache:
+    # ScheduleDates by the parameters of the schedules they were generated for, shared by all accounts of a process
+    # and dropped least recently used first
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._dates: OrderedDict[tuple, ScheduleDates] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, generate: Callable[[], ScheduleDates]) -> ScheduleDates:
+        with self._lock:
+            dates = self._dates.get(key)
+            if dates is not None:
+                self._dates.move_to_end(key)
+                self.hits += 1
+                return dates
+
+        dates = generate()
+
+        with self._lock:
+            # keep the first one generated when another thread got here first
+            dates = self._dates.setdefault(key, dates)
+            self._dates.move_to_end(key)
+            self.misses += 1
+            while len(self._dates) > self.max_size:
+                self._dates.popitem(last=False)
+
+        return dates
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def discard_calendar(self, calendar_name: str):
+        # keys of adjusted schedules start with the key of their calendar
+        with self._lock:
+            for key in [key for key in self._dates.keys() if key[0] is not None and key[0][0] == calendar_name]:
+                del self._dates[key]
+
+    def clear(self):
+        with self._lock:
+            self._dates.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+schedule_dates_cache = ScheduleDatesCache()
+
+
 class Schedule(BaseModel):
     start_date: date
     end_type: ScheduleEndType
@@ -50,7 +241,9 @@ class Schedule(BaseModel):
     number_of_repeats: int = 0
     include_dates: list[date] = []
     exclude_dates: list[date] = []
-    cached_dates: dict[date, date] = Field(default_factory=dict, exclude=True)
+    # registered calendar the adjustment uses, the default calendar when not set
+    calendar_name: Optional[str] = None
+    cached_dates: Optional[Any] = Field(default=None, exclude=True)
 
     class Config:
         # exclude the "cached_dates" field from JSON serialization
@@ -61,8 +254,29 @@ class Schedule(BaseModel):
                 self.interval == 1 and
                 self.adjustment == BusinessDayAdjustment.NO_ADJUSTMENT)
 
-    def __last_date(self):
-        return self.start_date + relativedelta(years=+50)
+    def __get_cached_dates(self, to_date: date) -> ScheduleDates:
+        # dates are shared with schedules of other accounts with the same parameters, and generated up to a horizon
+        # of 1, 2, 4, ... years after the start date covering the requested date;
+        # clear cached_dates after changing the schedule
+        cached_dates: Optional[ScheduleDates] = self.cached_dates or None
+
+        if cached_dates is not None and (cached_dates.complete or to_date <= cached_dates.horizon):
+            return cached_dates
+
+        years = 1
+        while (horizon := self.start_date + relativedelta(years=years)) < to_date:
+            years *= 2
+
+        self.cached_dates = schedule_dates_cache.get(self.__get_key(horizon), lambda: self.__generate(horizon))
+
+        return self.cached_dates
+
+    def __get_key(self, horizon: date) -> tuple:
+        calendar = None if self.adjustment == BusinessDayAdjustment.NO_ADJUSTMENT else \
+            calendar_registry.get_key(self.calendar_name)
+
+        return (calendar, self.start_date, self.end_type, self.frequency, self.interval, self.adjustment,
+                self.end_date, self.number_of_repeats, tuple(self.include_dates), tuple(self.exclude_dates), horizon)
 
     def is_due(self, test_date: date) -> bool:
         if self.__is_simple_daily_schedule():
@@ -71,60 +285,84 @@ class Schedule(BaseModel):
             elif self.end_type == ScheduleEndType.END_DATE:
                 return self.start_date <= test_date <= self.end_date
 
-        if not self.cached_dates:
-            # create dictionary of dates for each date
-            self.cached_dates = {date: date for date in self.get_all_dates(self.__last_date())}
+        return self.__get_cached_dates(test_date).is_due(test_date)
 
-        # check if test_date is in dictionary
-        return test_date in self.cached_dates
+    def get_due_dates(self, from_date: date, to_date: date) -> Iterator[date]:
+        # yields, in order, every date between from_date and to_date for which is_due returns True
+        if self.__is_simple_daily_schedule() and self.end_type != ScheduleEndType.END_REPEATS:
+            value_date = max(from_date, self.start_date)
 
-    def get_all_dates(self, to_date: date):
-        if self.cached_dates:
-            return self.cached_dates.keys()
+            if self.end_type == ScheduleEndType.END_DATE:
+                to_date = min(to_date, self.end_date)
 
-        dates: list[date] = []
-        repeats: int = 1
-        iterator: date = self.start_date
-        adjusted_date = self.__get_adjusted(iterator)
+            while value_date <= to_date:
+                yield value_date
+                value_date = value_date + timedelta(days=1)
 
-        while not self.__is_completed(repeats, adjusted_date, to_date):
-            dates.append(adjusted_date)
+            return
 
-            iterator = self.__next(repeats)
-            adjusted_date = self.__get_adjusted(iterator)
-            repeats += 1
+        dates = self.__get_cached_dates(to_date).dates
+        yield from dates[np.searchsorted(dates, np.datetime64(from_date, 'D')):
+                         np.searchsorted(dates, np.datetime64(to_date, 'D'), side='right')].tolist()
 
-        dates.extend(include_date for include_date in self.include_dates if include_date not in dates)
+    def get_all_dates(self, to_date: date) -> list[date]:
+        # include dates are returned even when they are after to_date
+        dates = self.__get_cached_dates(to_date).dates
+        last = np.searchsorted(dates, np.datetime64(to_date, 'D'), side='right')
+        later_includes = [d for d in dates[last:].tolist() if d in self.include_dates]
 
-        dates = [keep_date for keep_date in dates if keep_date not in self.exclude_dates]
+        return dates[:last].tolist() + later_includes
 
-        self.cached_dates = {iter: iter for iter in dates}
+    def __generate(self, horizon: date) -> ScheduleDates:
+        if self.interval < 1:
+            raise ValueError(f'Schedule interval must be positive, got {self.interval}')
 
-        return dates
+        if self.adjustment == BusinessDayAdjustment.NO_ADJUSTMENT:
+            dates, complete = self.__generate_dates(horizon)
+        else:
+            # dates a few days after the horizon can be adjusted to the horizon or before it
+            key = (self.start_date, self.end_type, self.frequency, self.interval, self.end_date,
+                   self.number_of_repeats, horizon)
+            dates, complete = calendar_registry.get_adjusted(
+                self.calendar_name, self.adjustment, key,
+                lambda: self.__generate_dates(horizon + timedelta(days=ADJUSTMENT_MARGIN_DAYS)))
 
-    def __next(self, repeats: int) -> date:
-        if self.frequency == ScheduleFrequency.DAILY:
-            return self.start_date + relativedelta(days=+ self.interval * repeats)
+        if self.include_dates:
+            dates = np.union1d(dates, np.array(self.include_dates, dtype='datetime64[D]'))
 
-        return self.start_date + relativedelta(months=+ self.interval * repeats)
+        if self.exclude_dates:
+            dates = np.setdiff1d(dates, np.array(self.exclude_dates, dtype='datetime64[D]'))
 
-    def __is_completed(self, repeats: int, test_date: date, last_date: date) -> bool:
-        if test_date > last_date:
-            return True
-        elif self.end_type == ScheduleEndType.END_DATE and test_date > self.end_date:
-            return True
-        elif self.end_type == ScheduleEndType.NO_END:
-            return False
+        return ScheduleDates(horizon, complete, dates)
 
-        return (self.end_type == ScheduleEndType.END_REPEATS and
-                repeats > self.number_of_repeats)
+    def __generate_dates(self, horizon: date) -> tuple[np.ndarray, bool]:
+        last_date = horizon
+        complete = False
 
-    def __get_adjusted(self, test_date: date):
-        if self.adjustment == BusinessDayAdjustment.NO_ADJUSTMENT:
-            return test_date
+        if self.end_type == ScheduleEndType.END_DATE and self.end_date is not None:
+            complete = self.end_date <= horizon
+            last_date = min(horizon, self.end_date)
+
+        start = np.datetime64(self.start_date, 'D')
+
+        if last_date < self.start_date:
+            dates = np.array([], dtype='datetime64[D]')
+        elif self.frequency == ScheduleFrequency.DAILY:
+            dates = start + np.arange(0, (last_date - self.start_date).days + 1, self.interval)
+        else:
+            # same day of month as the start date, or the last day of shorter months
+            months = (last_date.year - self.start_date.year) * 12 + last_date.month - self.start_date.month
+            month_starts = np.datetime64(self.start_date, 'M') + np.arange(0, months + 1, self.interval)
+            days_in_month = ((month_starts + 1).astype('datetime64[D]') -
+                             month_starts.astype('datetime64[D]')).astype(int)
+            dates = month_starts.astype('datetime64[D]') + np.minimum(self.start_date.day, days_in_month) - 1
+            dates = dates[dates <= np.datetime64(last_date, 'D')]
+
+        if self.end_type == ScheduleEndType.END_REPEATS:
+            complete = len(dates) >= self.number_of_repeats
+            dates = dates[:self.number_of_repeats]
 
-        # TODO add calendar and call get_adjusted()
-        return test_date
+        return dates, complete
 
 
 class ExternalTransaction(BaseModel):
@@ -135,14 +373,38 @@ class ExternalTransaction(BaseModel):
 
 class PropertyValue(BaseModel):
     value: Dict[date, Any] = {}
+    # sorted dates of value, rebuilt when value is replaced or changes size, and the index of the last lookup
+    _lookup: DerivedState = PrivateAttr(default_factory=DerivedState)
 
     def __getitem__(self, value_date: date):
-        # find first date that is less than or equal to value_date
-        index_date = max([d for d in self.value.keys() if d <= value_date])
-        return self.value[index_date]
+        # find last date that is less than or equal to value_date
+        # pydantic resolves private attributes in __getattr__, which is slow for a lookup made every day
+        lookup = self.__pydantic_private__["_lookup"]
+        dates = lookup.dates
+
+        if dates is None or lookup.value is not self.value or len(dates) != len(self.value):
+            dates = lookup.dates = sorted(self.value.keys())
+            lookup.value = self.value
+            lookup.cursor = 0
+
+        # forecasts read increasing dates, so the date is mostly the one or the next one of the last lookup
+        cursor = lookup.cursor
+        if cursor >= len(dates) or value_date < dates[cursor]:
+            cursor = bisect_right(dates, value_date) - 1
+        elif cursor + 1 < len(dates) and dates[cursor + 1] <= value_date:
+            cursor += 1
+            if cursor + 1 < len(dates) and dates[cursor + 1] <= value_date:
+                cursor = bisect_right(dates, value_date) - 1
+
+        if cursor < 0:
+            raise ValueError(f"No value on or before {value_date}")
+
+        lookup.cursor = cursor
+        return self.value[dates[cursor]]
 
     def __setitem__(self, value_date: date, value):
         self.value[value_date] = value
+        self._lookup.dates = None
 
 
 class Instalment(BaseModel):
@@ -150,6 +412,13 @@ class Instalment(BaseModel):
     is_fixed: bool
 
 
+class Checkpoint(BaseModel):
+    # account state at the end of value_date
+    value_date: date
+    positions: dict[str, Decimal]
+    transaction_count: int
+
+
 class Account(BaseModel):
     start_date: date
     account_type_name: str
@@ -159,7 +428,16 @@ class Account(BaseModel):
     dates: dict[str, date] = {}
     schedules: dict[str, Schedule] = {}
     transactions: list[Transaction] = []
-    instalments: dict[str, Instalment] = {}
+    # forecast transactions when the valuation uses TransactionStorage.COLUMNAR, transactions is then empty
+    transaction_log: Optional[Any] = Field(default=None, exclude=True)
+    # plain position amounts while a valuation is running, written back to positions when it completes,
+    # positions then holds a PositionView of each and position_models the Position models
+    position_amounts: Optional[dict[str, Decimal]] = Field(default=None, exclude=True)
+    position_models: Optional[dict[str, Position]] = Field(default=None, exclude=True)
+    # amount of instalments on the instalment schedule, instalments holds the ones that differ or are not on it
+    instalment_amount: Decimal = Decimal(0)
+    instalments: dict[date, Instalment] = {}
+    checkpoints: list[Checkpoint] = []
 
     def __init__(self, **kw):
         super().__init__(**kw)
@@ -168,7 +446,7 @@ class Account(BaseModel):
             self.__validate_properties(account_type)
             self.__initialize_positions(account_type)
             self.__initialize_schedules(account_type)
-            self.__initialize_instalment(account_type)
+        self.__validate_calendars()
 
     def __validate_properties(self, account_type: AccountType):
         for property_type in account_type.property_types:
@@ -180,6 +458,12 @@ class Account(BaseModel):
                 if property_type.name not in self.properties:
                     raise ValueError(f"Property {property_type.name} is required for account type {account_type.name}")
 
+    def __validate_calendars(self):
+        # raises ValueError when the calendar of an adjusted schedule is not registered
+        for schedule in self.schedules.values():
+            if schedule.adjustment != BusinessDayAdjustment.NO_ADJUSTMENT:
+                calendar_registry.get(schedule.calendar_name)
+
     def __initialize_schedules(self, account_type: AccountType):
         for schedule_type in account_type.schedule_types:
             # skip if schedule already exists
@@ -195,7 +479,8 @@ class Account(BaseModel):
                 interval=self.evaluate(schedule_type.interval_expression, {"accountType": account_type,
                                                                            "account": self,
                                                                            "value_date": self.start_date}),
-                adjustment=schedule_type.business_day_adjustment)
+                adjustment=schedule_type.business_day_adjustment,
+                calendar_name=schedule_type.calendar_name)
 
             if schedule_type.end_date_expression:
                 schedule.end_date = self.evaluate(schedule_type.end_date_expression,
@@ -214,41 +499,129 @@ class Account(BaseModel):
                 if rule.position_type_name not in self.positions:
                     self.positions[rule.position_type_name] = Position()
 
-    def __initialize_instalment(self, account_type: AccountType):
-        instalment_type = account_type.instalment_type
-
-        # if no instalments create default one
-        if instalment_type and len(self.instalments.items()) == 0:
-            for date_value in self.schedules[instalment_type.schedule_name].get_all_dates(
-                    self.start_date + relativedelta(years=+50)):
-                self.instalments[date_value.strftime("%Y-%m-%d")] = Instalment(amount=Decimal(0), is_fixed=False)
-
     def apply_calculated_installment(self, amount: Decimal):
         # set all instalments to calculated amount if fixed is false
+        self.instalment_amount = amount
         for instalment in self.instalments.values():
             if not instalment.is_fixed:
                 instalment.amount = amount
 
+    def is_instalment_scheduled(self, schedule_name: str, value_date: date) -> bool:
+        return self.schedules[schedule_name].is_due(value_date) and \
+            value_date <= self.start_date + relativedelta(years=INSTALMENT_YEARS)
+
+    def get_instalment(self, schedule_name: str, value_date: date) -> Optional[Instalment]:
+        instalment = self.instalments.get(value_date)
+
+        if instalment is None and self.is_instalment_scheduled(schedule_name, value_date):
+            return Instalment(amount=self.instalment_amount, is_fixed=False)
+
+        return instalment
+
+    def get_instalment_dates(self, schedule_name: str, from_date: date, to_date: date) -> list[date]:
+        # sorted dates of the instalments between from_date and to_date
+        end_date = min(to_date, self.start_date + relativedelta(years=INSTALMENT_YEARS))
+        instalment_dates = set(self.schedules[schedule_name].get_due_dates(from_date, end_date))
+        instalment_dates.update(value_date for value_date in self.instalments if from_date <= value_date <= to_date)
+
+        return sorted(instalment_dates)
+
+    def create_checkpoint(self, value_date: date):
+        self.checkpoints.append(Checkpoint(value_date=value_date,
+                                           positions=self.get_position_amounts(),
+                                           transaction_count=self.get_transaction_count()))
+
+    def get_checkpoint(self, value_date: date) -> Optional[Checkpoint]:
+        # latest checkpoint taken before value_date
+        return next((checkpoint for checkpoint in reversed(self.checkpoints) if checkpoint.value_date < value_date),
+                    None)
+
+    def restore_checkpoint(self, checkpoint: Checkpoint) -> list[Transaction]:
+        # returns transactions posted after the checkpoint
+        for name, amount in checkpoint.positions.items():
+            self.positions[name].amount = amount
+
+        if self.transaction_log is not None:
+            reverted = self.transaction_log.truncate(checkpoint.transaction_count)
+        else:
+            reverted = self.transactions[checkpoint.transaction_count:]
+            self.transactions = self.transactions[:checkpoint.transaction_count]
+        self.checkpoints = [c for c in self.checkpoints if c.value_date <= checkpoint.value_date]
+
+        return reverted
+
+    def open_positions(self):
+        self.position_amounts = self.get_position_amounts()
+        self.position_models = dict(self.positions)
+
+        for name in self.position_models.keys():
+            self.positions[name] = PositionView(self.position_amounts, name)
+
+    def close_positions(self):
+        for name, position in self.position_models.items():
+            position.amount = self.position_amounts[name]
+            self.positions[name] = position
+
+        self.position_amounts = None
+        self.position_models = None
+
+    def get_position_amount(self, name: str) -> Decimal:
+        if self.position_amounts is None:
+            return self.positions[name].amount
+        return self.position_amounts[name]
+
+    def get_position_amounts(self) -> dict[str, Decimal]:
+        return {name: self.get_position_amount(name) for name in self.positions.keys()}
+
+    def get_transactions(self, start: int = 0) -> list[Transaction]:
+        if self.transaction_log is not None:
+            return self.transaction_log[start:]
+        return self.transactions[start:]
+
+    def get_transaction_count(self) -> int:
+        if self.transaction_log is not None:
+            return len(self.transaction_log)
+        return len(self.transactions)
+
     def add_transaction(self, transaction: Transaction, transaction_type: TransactionType) -> dict[str, Decimal]:
-        updated_positions: dict[str, Decimal] = {}
-        for rule in transaction_type.position_rules:
-            position = self.positions[rule.position_type_name]
-            position.apply_operation(rule.operation, transaction.amount)
-            updated_positions[rule.position_type_name] = position.amount
+        self.apply_position_rules(transaction_type, transaction.amount)
 
         self.transactions.append(transaction)
 
-        return updated_positions
+        return self.get_updated_positions(transaction_type)
+
+    def apply_position_rules(self, transaction_type: TransactionType, amount: Decimal):
+        if self.position_amounts is None:
+            for rule in transaction_type.position_rules:
+                self.positions[rule.position_type_name].apply_operation(rule.operation, amount)
+            return
+
+        amounts = self.position_amounts
+
+        for rule in transaction_type.position_rules:
+            name = rule.position_type_name
+            if rule.operation == TransactionOperation.CREDIT:
+                amounts[name] = amounts[name] + amount
+            elif rule.operation == TransactionOperation.DEBIT:
+                amounts[name] = amounts[name] - amount
+            else:
+                amounts[name] = amount
+
+    def get_updated_positions(self, transaction_type: TransactionType) -> dict[str, Decimal]:
+        return {rule.position_type_name: self.get_position_amount(rule.position_type_name)
+                for rule in transaction_type.position_rules}
 
     def evaluate(self, expression: str, locals: Optional[Mapping[str, Any]]) -> Any:
         try:
-            value = eval(expression, None, locals)
+            value = eval(compile_expression(expression), None, locals)
         except Exception as e:
             raise ValueError(f'Error evaluating expression: {expression} {e.args}') from e
         else:
             return value
 
     def __getattr__(self, method_name):
+        if self.position_amounts is not None and method_name in self.position_amounts:
+            return self.position_amounts[method_name]
         if method_name in self.positions:
             return self.positions[method_name].amount
         if method_name in self.properties:
@@ -328,12 +701,96 @@ class TransactionTrace(BaseModel):
         return f" {self.transaction.value_date} {self.transaction.transaction_type} {self.transaction.amount} {self.positions}"
 
 
+class ForecastEngine(Enum):
+    DAILY = "daily"
+    EVENT_DRIVEN = "event_driven"
+
+
+class AccrualAggregation(Enum):
+    NONE = "none"
+    SUMMARIZED = "summarized"
+    DAILY = "daily"
+
+
+def _get_account_attributes(expression: str) -> Optional[set[str]]:
+    # attributes of account read by an expression, or None when the expression can not be aggregated over a span:
+    # it reads account other than through simple attributes or depends on value_date outside of rate and
+    # value dated property lookups
+    tree = ast.parse(expression, mode='eval')
+    attributes: set[str] = set()
+    allowed: set[int] = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "account":
+            attributes.add(node.attr)
+            allowed.add(id(node.value))
+        elif isinstance(node, ast.Subscript):
+            allowed.add(id(node.slice))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and \
+                node.func.attr in ("get_rate", "get_fee"):
+            allowed.update(id(arg) for arg in node.args)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in ("account", "value_date") and id(node) not in allowed:
+            return None
+
+    if attributes & {"positions", "transactions", "instalments"}:
+        return None
+
+    return attributes
+
+
+class CheckpointInterval(Enum):
+    NONE = "none"
+    MONTH_END = "month_end"
+    YEAR_END = "year_end"
+
+
+class InstalmentSolver(Enum):
+    BRENTQ = "brentq"
+    SECANT = "secant"
+
+
+class TransactionStorage(Enum):
+    MODELS = "models"
+    # forecast transactions kept in account.transaction_log without validating a model per transaction
+    COLUMNAR = "columnar"
+
+
+class SolverIteration(BaseModel):
+    value: Decimal
+    residual: Decimal
+    elapsed: float
+    forecast_days: int
+
+
+class ForecastEvent(IntEnum):
+    # events on the same value date are processed in this order
+    START_OF_DAY = 0
+    INSTALMENT = 1
+    EXTERNAL = 2
+    END_OF_DAY = 3
+    CHECKPOINT = 4
+
+
 class AccountValuation(BaseModel):
     account: Account
     account_type: AccountType
     action_date: date
     trace: bool = False
     trace_list: List[TransactionTrace] = []
+    engine: ForecastEngine = ForecastEngine.DAILY
+    accrual_aggregation: AccrualAggregation = AccrualAggregation.NONE
+    checkpoint_interval: CheckpointInterval = CheckpointInterval.NONE
+    to_value_date: Optional[date] = None
+    instalment_solver: InstalmentSolver = InstalmentSolver.BRENTQ
+    solver_forecasts: int = 0
+    # last solver_log_size iterations of solve_instalment, none are kept by default
+    solver_log_size: int = 0
+    solver_log: List[SolverIteration] = []
+    transaction_storage: TransactionStorage = TransactionStorage.MODELS
+    # e.g. ProfilingInstrumentation to time schedule checks, expressions, triggers, postings and solver forecasts
+    instrumentation: Any = Field(default=no_instrumentation, exclude=True)
 
     def init_account(self):
         # reset all positions to zero
@@ -341,11 +798,63 @@ class AccountValuation(BaseModel):
             position.amount = Decimal(0)
 
         self.account.transactions = []
+        self.account.transaction_log = TransactionLog() \
+            if self.transaction_storage == TransactionStorage.COLUMNAR else None
+        self.account.checkpoints = []
 
         self.trace_list = []
 
     def forecast(self, to_value_date: date, external_transactions: dict[date, List[ExternalTransaction]]):
-        value_date = self.account.start_date
+        if self.transaction_storage == TransactionStorage.COLUMNAR and self.account.transaction_log is None:
+            self.account.transaction_log = TransactionLog()
+
+        start = perf_counter() if self.instrumentation.enabled else None
+
+        self.__forecast(self.account.start_date, to_value_date, external_transactions)
+
+        if start is not None:
+            self.instrumentation.record(ValuationPhase.FORECAST, self.account_type.name, start)
+
+    def revalue_from(self, value_date: date, external_transactions: dict[date, List[ExternalTransaction]],
+                     to_value_date: Optional[date] = None) -> Dict[date, list[TransactionDifference]]:
+        # replays from the latest checkpoint before value_date and returns corrections to the previous valuation
+        to_value_date = to_value_date or self.to_value_date
+
+        if to_value_date is None:
+            raise ValueError('Account has to be forecast before it can be revalued')
+
+        checkpoint = self.account.get_checkpoint(value_date)
+
+        if checkpoint is None:
+            original = self.account.get_transactions()
+            self.init_account()
+            self.forecast(to_value_date, external_transactions)
+
+            return valuation_difference(original, self.account.get_transactions())
+
+        original = self.account.restore_checkpoint(checkpoint)
+        self.__forecast(checkpoint.value_date + timedelta(days=1), to_value_date, external_transactions)
+
+        return valuation_difference(original, self.account.get_transactions(checkpoint.transaction_count))
+
+    def __forecast(self, from_value_date: date, to_value_date: date,
+                   external_transactions: dict[date, List[ExternalTransaction]]):
+        self.to_value_date = to_value_date
+
+        # account.<position> and account.positions[name].amount read the plain amounts while forecasting
+        self.account.open_positions()
+        try:
+            self.__forecast_days(from_value_date, to_value_date, external_transactions)
+        finally:
+            self.account.close_positions()
+
+    def __forecast_days(self, from_value_date: date, to_value_date: date,
+                        external_transactions: dict[date, List[ExternalTransaction]]):
+        if self.engine == ForecastEngine.EVENT_DRIVEN or self.accrual_aggregation != AccrualAggregation.NONE:
+            self.__forecast_events(from_value_date, to_value_date, external_transactions)
+            return
+
+        value_date = from_value_date
 
         self.start_of_day(value_date)
         self.process_external_transactions(value_date, external_transactions)
@@ -353,11 +862,188 @@ class AccountValuation(BaseModel):
         while value_date < to_value_date:
             self.end_of_day(value_date)
 
+            if self.__is_checkpoint_date(value_date):
+                self.account.create_checkpoint(value_date)
+
             value_date = value_date + timedelta(days=1)
 
             self.start_of_day(value_date)
             self.process_external_transactions(value_date, external_transactions)
 
+    def __is_checkpoint_date(self, value_date: date) -> bool:
+        if self.checkpoint_interval == CheckpointInterval.NONE:
+            return False
+
+        next_date = value_date + timedelta(days=1)
+
+        if self.checkpoint_interval == CheckpointInterval.MONTH_END:
+            return next_date.day == 1
+
+        return next_date.day == 1 and next_date.month == 1
+
+    def __forecast_events(self, from_value_date: date, to_value_date: date,
+                          external_transactions: dict[date, List[ExternalTransaction]]):
+        # same transactions as the daily loop, but only visits dates on which something is due
+        events = heapq.merge(*self.__get_event_streams(from_value_date, to_value_date, external_transactions))
+
+        # trace needs positions after every single posting, so spans are never aggregated while tracing
+        if self.accrual_aggregation == AccrualAggregation.NONE or self.trace:
+            for value_date, event, index in events:
+                self.__process_event(value_date, event, index, external_transactions)
+            return
+
+        aggregated = self.__get_aggregated_transactions()
+        change_dates = self.__get_change_dates()
+        span: dict[int, list[date]] = {}
+
+        for value_date, day_events in groupby(events, key=lambda e: e[0]):
+            day_events = list(day_events)
+            accrual_only = all(event in (ForecastEvent.START_OF_DAY, ForecastEvent.END_OF_DAY) and index in aggregated
+                               for _, event, index in day_events)
+
+            # a span ends before any other event and before a rate or property value change
+            if span and (not accrual_only or value_date in change_dates):
+                self.__create_span_transactions(span)
+                span = {}
+
+            if accrual_only:
+                for _, _, index in day_events:
+                    span.setdefault(index, []).append(value_date)
+            else:
+                for _, event, index in day_events:
+                    self.__process_event(value_date, event, index, external_transactions)
+
+        if span:
+            self.__create_span_transactions(span)
+
+    def __process_event(self, value_date: date, event: ForecastEvent, index: int,
+                        external_transactions: dict[date, List[ExternalTransaction]]):
+        if event == ForecastEvent.CHECKPOINT:
+            self.account.create_checkpoint(value_date)
+        elif event == ForecastEvent.INSTALMENT:
+            self.__create_instalment_transaction(value_date)
+        elif event == ForecastEvent.EXTERNAL:
+            self.process_external_transactions(value_date, external_transactions)
+        else:
+            self.__create_scheduled_transaction(value_date, self.account_type.scheduled_transactions[index])
+
+    def __get_aggregated_transactions(self) -> set[int]:
+        # scheduled transactions whose amount stays the same for as long as only they are posted:
+        # no trigger, no SET rule and no reads of positions they (or other aggregated transactions) update
+        candidates: dict[int, tuple[set[str], set[str]]] = {}
+
+        for index, scheduled_transaction in enumerate(self.account_type.scheduled_transactions):
+            transaction_type = self.account_type.get_transaction_type(scheduled_transaction.generated_transaction_type)
+            reads = _get_account_attributes(scheduled_transaction.amount_expression)
+            writes = {rule.position_type_name for rule in transaction_type.position_rules}
+
+            if reads is None or reads & writes or \
+                    self.account_type.get_trigger_transaction(transaction_type.name) or \
+                    any(rule.operation == TransactionOperation.SET for rule in transaction_type.position_rules):
+                continue
+
+            candidates[index] = (reads, writes)
+
+        while True:
+            reads = set().union(*(reads for reads, _ in candidates.values()))
+            conflicting = [index for index, (_, writes) in candidates.items() if writes & reads]
+
+            if not conflicting:
+                return set(candidates.keys())
+
+            for index in conflicting:
+                del candidates[index]
+
+    def __get_change_dates(self) -> set[date]:
+        change_dates = {date.fromisoformat(key)
+                        for rate_type in self.account_type.rate_types.values()
+                        for key in rate_type.rate_tiers.keys()}
+
+        for value in chain(self.account.properties.values(), self.account.value_dated_properties.values()):
+            if isinstance(value, PropertyValue):
+                change_dates.update(value.value.keys())
+
+        return change_dates
+
+    def __create_span_transactions(self, span: dict[int, list[date]]):
+        for index in sorted(span.keys()):
+            scheduled_transaction = self.account_type.scheduled_transactions[index]
+            value_dates = span[index]
+            transaction_type = self.account_type.get_transaction_type(scheduled_transaction.generated_transaction_type)
+
+            amount = self.__calculate_amount(value_dates[0], transaction_type, scheduled_transaction.amount_expression)
+
+            if amount == Decimal(0):
+                continue
+
+            if self.accrual_aggregation == AccrualAggregation.SUMMARIZED:
+                self.__create_transaction(transaction_type, value_dates[-1], amount * len(value_dates), True)
+                continue
+
+            start = perf_counter() if self.instrumentation.enabled else None
+            self.account.apply_position_rules(transaction_type, amount * len(value_dates))
+            if start is not None:
+                self.instrumentation.record(ValuationPhase.POSITION_UPDATE, transaction_type.name, start)
+
+            if self.account.transaction_log is not None:
+                for value_date in value_dates:
+                    self.account.transaction_log.append(self.action_date, value_date, transaction_type.name, amount,
+                                                        True)
+                continue
+
+            self.account.transactions.extend(
+                Transaction(action_date=self.action_date, value_date=value_date,
+                            transaction_type=transaction_type.name, amount=amount, system_generated=True)
+                for value_date in value_dates)
+
+    def __get_event_streams(self, start_date: date, to_value_date: date,
+                            external_transactions: dict[date, List[ExternalTransaction]]) -> list[Iterator]:
+        # end of day is never processed on to_value_date itself
+        last_end_of_day = to_value_date - timedelta(days=1)
+
+        streams: list[Iterator] = []
+
+        for index, scheduled_transaction in enumerate(self.account_type.scheduled_transactions):
+            schedule = self.account.schedules[scheduled_transaction.schedule_name]
+
+            if scheduled_transaction.timing == ScheduledTransactionTiming.START_OF_DAY:
+                streams.append(self.__get_schedule_events(schedule, start_date, max(start_date, to_value_date),
+                                                          ForecastEvent.START_OF_DAY, index))
+            else:
+                streams.append(self.__get_schedule_events(schedule, start_date, last_end_of_day,
+                                                          ForecastEvent.END_OF_DAY, index))
+
+        if self.account_type.instalment_type and \
+                self.account_type.instalment_type.timing == ScheduledTransactionTiming.START_OF_DAY:
+            instalment_dates = self.account.get_instalment_dates(self.account_type.instalment_type.schedule_name,
+                                                                 start_date, max(start_date, to_value_date))
+            streams.append((value_date, ForecastEvent.INSTALMENT, 0) for value_date in instalment_dates)
+
+        if external_transactions:
+            streams.append((value_date, ForecastEvent.EXTERNAL, 0) for value_date in sorted(external_transactions)
+                           if start_date <= value_date <= max(start_date, to_value_date))
+
+        if self.checkpoint_interval != CheckpointInterval.NONE:
+            streams.append(self.__get_checkpoint_events(start_date, last_end_of_day))
+
+        return streams
+
+    def __get_checkpoint_events(self, from_date: date, to_date: date) -> Iterator[tuple[date, ForecastEvent, int]]:
+        months = 1 if self.checkpoint_interval == CheckpointInterval.MONTH_END else 12
+        # first period end on or after from_date
+        value_date = date(from_date.year, from_date.month if months == 1 else 12, 1) + \
+            relativedelta(months=+1, days=-1)
+
+        while value_date <= to_date:
+            yield value_date, ForecastEvent.CHECKPOINT, 0
+            value_date = value_date + timedelta(days=1) + relativedelta(months=+months) - timedelta(days=1)
+
+    @staticmethod
+    def __get_schedule_events(schedule: Schedule, from_date: date, to_date: date, event: ForecastEvent,
+                              index: int) -> Iterator[tuple[date, ForecastEvent, int]]:
+        for value_date in schedule.get_due_dates(from_date, to_date):
+            yield value_date, event, index
+
     def process_external_transactions(self, value_date: date,
                                       external_transactions: dict[date, List[ExternalTransaction]]):
         if value_date in external_transactions:
@@ -370,32 +1056,54 @@ class AccountValuation(BaseModel):
             if scheduled_transaction.timing == ScheduledTransactionTiming.START_OF_DAY:
                 self.__create_transaction_if_due(value_date, scheduled_transaction)
 
-        value_date_str = value_date.strftime('%Y-%m-%d')
-
         if self.account_type.instalment_type:
-            if self.account_type.instalment_type.timing == ScheduledTransactionTiming.START_OF_DAY \
-                    and value_date_str in self.account.instalments:
-                instalment = self.account.instalments[value_date_str]
-                transaction_type = self.account_type.get_transaction_type(
-                    self.account_type.instalment_type.transaction_type)
-                self.__create_transaction(transaction_type, value_date, instalment.amount, True)
+            if self.account_type.instalment_type.timing == ScheduledTransactionTiming.START_OF_DAY:
+                self.__create_instalment_transaction(value_date)
+
+    def __create_instalment_transaction(self, value_date: date):
+        instalment = self.account.get_instalment(self.account_type.instalment_type.schedule_name, value_date)
+
+        if instalment is not None:
+            transaction_type = self.account_type.get_transaction_type(
+                self.account_type.instalment_type.transaction_type)
+            self.__create_transaction(transaction_type, value_date, instalment.amount, True)
 
     def __create_transaction_if_due(self, value_date: date, scheduled_transaction: ScheduledTransaction):
         schedule = self.account.schedules[scheduled_transaction.schedule_name]
 
-        if schedule.is_due(value_date):
-            transaction_type = self.account_type.get_transaction_type(scheduled_transaction.generated_transaction_type)
+        start = perf_counter() if self.instrumentation.enabled else None
+        is_due = schedule.is_due(value_date)
+        if start is not None:
+            self.instrumentation.record(ValuationPhase.SCHEDULE_DUE_CHECK, scheduled_transaction.schedule_name, start)
+
+        if is_due:
+            self.__create_scheduled_transaction(value_date, scheduled_transaction)
 
-            self.__create_calculated_transaction(value_date, transaction_type, scheduled_transaction.amount_expression)
+    def __create_scheduled_transaction(self, value_date: date, scheduled_transaction: ScheduledTransaction):
+        transaction_type = self.account_type.get_transaction_type(scheduled_transaction.generated_transaction_type)
+
+        self.__create_calculated_transaction(value_date, transaction_type, scheduled_transaction.amount_expression)
 
     def __create_calculated_transaction(self, value_date: date, transaction_type: TransactionType,
                                         amount_expression: str):
+        amount = self.__calculate_amount(value_date, transaction_type, amount_expression)
+
+        if amount != Decimal(0):
+            self.__create_transaction(transaction_type, value_date, amount, True)
+
+    def __calculate_amount(self, value_date: date, transaction_type: TransactionType,
+                           amount_expression: str) -> Decimal:
+        start = perf_counter() if self.instrumentation.enabled else None
+
         try:
             amount = self.account.evaluate(amount_expression,
                                            {"accountType": self.account_type,
                                             "account": self.account,
                                             "value_date": value_date})
 
+            if start is not None:
+                self.instrumentation.record(ValuationPhase.EXPRESSION, amount_expression, start)
+
             if not transaction_type.maximum_precision:
                 amount = Decimal(round(amount, 2))
 
@@ -403,24 +1111,37 @@ class AccountValuation(BaseModel):
             raise Exception(
                 f'Error calculating {transaction_type.name} on {value_date} expression : {amount_expression} {e.args}') from e
         else:
-            if amount != Decimal(0):
-                self.__create_transaction(transaction_type, value_date, amount, True)
+            return amount
 
     def __create_transaction(self, transaction_type: TransactionType, value_date: date,
                              amount: Decimal, system_generated: bool):
+        triggered_transaction = self.account_type.get_trigger_transaction(transaction_type.name)
 
-        transaction = Transaction(action_date=self.action_date, value_date=value_date,
-                                  transaction_type=transaction_type.name,
-                                  amount=amount, system_generated=system_generated)
+        start = perf_counter() if self.instrumentation.enabled else None
+        self.account.apply_position_rules(transaction_type, amount)
+        if start is not None:
+            self.instrumentation.record(ValuationPhase.POSITION_UPDATE, transaction_type.name, start)
 
-        positions = self.account.add_transaction(transaction, transaction_type)
+        if self.account.transaction_log is not None:
+            self.account.transaction_log.append(self.action_date, value_date, transaction_type.name, amount,
+                                                system_generated)
 
-        if self.trace:
-            self.trace_list.append(TransactionTrace(transaction=transaction, positions=positions))
+            # a model is only needed for tracing and trigger expressions
+            if self.trace or triggered_transaction:
+                transaction = self.account.transaction_log[-1]
+        else:
+            transaction = Transaction(action_date=self.action_date, value_date=value_date,
+                                      transaction_type=transaction_type.name,
+                                      amount=amount, system_generated=system_generated)
+            self.account.transactions.append(transaction)
 
-        triggered_transaction = self.account_type.get_trigger_transaction(transaction_type.name)
+        if self.trace:
+            self.trace_list.append(TransactionTrace(transaction=transaction,
+                                                    positions=self.account.get_updated_positions(transaction_type)))
 
         if triggered_transaction:
+            start = perf_counter() if self.instrumentation.enabled else None
+
             trigger_amount = self.account.evaluate(triggered_transaction.amount_expression,
                                                    {"transaction": transaction,
                                                     "accountType": self.account_type,
@@ -431,26 +1152,92 @@ class AccountValuation(BaseModel):
                 triggered_transaction.generated_transaction_type)
             self.__create_transaction(generated_transaction_type, value_date, trigger_amount, True)
 
+            if start is not None:
+                self.instrumentation.record(ValuationPhase.TRIGGER,
+                                            f"{transaction_type.name} -> {generated_transaction_type.name}", start)
+
     def end_of_day(self, value_date):
         for scheduled_transaction in self.account_type.scheduled_transactions:
             if scheduled_transaction.timing == ScheduledTransactionTiming.END_OF_DAY:
                 self.__create_transaction_if_due(value_date, scheduled_transaction)
 
     def __calculate_for_instalment(self, value: Decimal) -> Decimal:
+        start = perf_counter() if self.instrumentation.enabled or self.solver_log_size > 0 else None
+        self.solver_forecasts += 1
         self.init_account()
 
+        solve_for_date = self.account.dates[self.account_type.instalment_type.solve_for_date]
         self.account.apply_calculated_installment(value)
-        self.forecast(self.account.dates[self.account_type.instalment_type.solve_for_date], {})
+        self.forecast(solve_for_date, {})
         result = self.account.positions[self.account_type.instalment_type.solve_for_zero_position].amount
-        print(f'instalment {value} -> {self.account_type.instalment_type.solve_for_zero_position} {result}')
+
+        if start is not None and self.solver_log_size > 0:
+            self.solver_log.append(SolverIteration(value=value, residual=result, elapsed=perf_counter() - start,
+                                                   forecast_days=(solve_for_date - self.account.start_date).days))
+            if len(self.solver_log) > self.solver_log_size:
+                del self.solver_log[0]
+
+        if start is not None and self.instrumentation.enabled:
+            self.instrumentation.record(ValuationPhase.INSTALMENT_SOLVER, self.account_type.instalment_type.name,
+                                        start)
         return result
 
     def __calculate_for_instalment_float(self, value: float) -> float:
         return float(self.__calculate_for_instalment(Decimal(value)))
 
+    def __solve_instalment_secant(self, xtol: Decimal = Decimal('0.01'), max_iterations: int = 8) -> Optional[Decimal]:
+        # the solved position is (close to) affine in the instalment amount, so secant steps converge in 3-4
+        # forecasts; returns None when they do not and brentq has to be used instead
+        solve_for_date = self.account.dates[self.account_type.instalment_type.solve_for_date]
+        schedule_name = self.account_type.instalment_type.schedule_name
+        count = sum(1 for value_date in self.account.get_instalment_dates(schedule_name, self.account.start_date,
+                                                                          solve_for_date)
+                    if not self.account.get_instalment(schedule_name, value_date).is_fixed)
+
+        if count == 0:
+            return None
+
+        previous_value = Decimal(0)
+        previous_result = self.__calculate_for_instalment(previous_value)
+
+        if previous_result == Decimal(0):
+            return previous_value
+
+        # previous_result / count would repay the loan if there was no interest, and overshoots into the range
+        # where the solved position turns negative before the last instalment and the residual is no longer
+        # affine, so the second probe is taken half way to it
+        value = previous_result / Decimal(2 * count)
+        result = self.__calculate_for_instalment(value)
+
+        for _ in range(max_iterations):
+            if result == Decimal(0):
+                return value
+
+            if result == previous_result:
+                return None
+
+            next_value = value - result * (value - previous_value) / (result - previous_result)
+
+            if abs(next_value - value) < xtol:
+                return next_value
+
+            previous_value, previous_result = value, result
+            value = next_value
+            result = self.__calculate_for_instalment(value)
+
+        return None
+
     def solve_instalment(self) -> Decimal:
-        amount = scipy.optimize.brentq(self.__calculate_for_instalment_float, float(-100000000), float(100000000),
-                                       xtol=float(0.01))
+        self.solver_forecasts = 0
+        self.solver_log = []
+        amount = None
+
+        if self.instalment_solver == InstalmentSolver.SECANT:
+            amount = self.__solve_instalment_secant()
+
+        if amount is None:
+            amount = scipy.optimize.brentq(self.__calculate_for_instalment_float, float(-100000000),
+                                           float(100000000), xtol=float(0.01))
 
         amount = Decimal(round(amount, 2))
         # apply amount to instalments
@@ -479,16 +1266,98 @@ class BusinessDayCalculation(Enum):
     NEXT_BUSINESS_DAY_THIS_MONTH_OR_PREVIOUS = "NextBusinessDayThisMonthOrPrevious"
 
 
+class BusinessDays:
+    # business days from first_date to last_date, and for every day the offset from first_date of the next
+    # (on or after) and previous (on or before) business day, -1 when there is none in the range
+    __slots__ = ("first_date", "last_date", "business", "next_offsets", "previous_offsets")
+
+    def __init__(self, first_date: date, last_date: date, holidays: Iterable[date]):
+        self.first_date = first_date
+        self.last_date = last_date
+
+        days = (last_date - first_date).days + 1
+        offsets = np.arange(days)
+        # 1970-01-01 is a Thursday
+        weekdays = (np.arange(np.datetime64(first_date, 'D'), np.datetime64(last_date, 'D') + 1)
+                    .astype(np.int64) + 3) % 7
+        self.business = weekdays < 5
+
+        holiday_offsets = [(holiday - first_date).days for holiday in holidays if first_date <= holiday <= last_date]
+        self.business[holiday_offsets] = False
+
+        next_offsets = np.minimum.accumulate(np.where(self.business, offsets, days)[::-1])[::-1]
+        self.next_offsets = np.where(next_offsets == days, -1, next_offsets)
+        self.previous_offsets = np.maximum.accumulate(np.where(self.business, offsets, -1))
+
+    def covers(self, from_date: date, to_date: date) -> bool:
+        return self.first_date <= from_date and to_date <= self.last_date
+
+
 class Calendar(BaseModel):
     name: str
     is_default: bool
     holidays: List[HolidayDate] = []
     holidays_map: Dict[date, HolidayDate] = None
+    # BusinessDays precomputed from the holidays
+    _lookups: DerivedState = PrivateAttr(default_factory=DerivedState)
 
     def add(self, description: str, value: date) -> 'Calendar':
         self.holidays.append(HolidayDate(description=description, value=value))
+        self.holidays_map = None
+        self._lookups.business_days = None
         return self
 
+    def precompute(self, from_date: date, to_date: date) -> 'Calendar':
+        # adjustments of dates in the range are lookups, dates outside of it extend the range by a year
+        self._lookups.business_days = BusinessDays(from_date, to_date,
+                                                   (holiday.value for holiday in self.holidays))
+        return self
+
+    def __get_business_days(self, from_date: date, to_date: date) -> BusinessDays:
+        # pydantic resolves private attributes in __getattr__, which is slow for lookups made every day
+        business_days = self.__pydantic_private__["_lookups"].business_days
+
+        if business_days is None or not business_days.covers(from_date, to_date):
+            if business_days is not None:
+                from_date = min(from_date, business_days.first_date)
+                to_date = max(to_date, business_days.last_date)
+            self.precompute(from_date - timedelta(days=366), to_date + timedelta(days=366))
+            business_days = self.__pydantic_private__["_lookups"].business_days
+
+        return business_days
+
+    def adjust_many(self, dates: Iterable[date], adjustment: BusinessDayCalculation) -> np.ndarray:
+        # same as get_calculated_business_day for each of dates, as datetime64[D]
+        values = np.asarray(dates, dtype='datetime64[D]')
+
+        if adjustment == BusinessDayCalculation.ANY_DAY or len(values) == 0:
+            return values
+
+        business_days = self.__get_business_days(values.min().item(), values.max().item())
+        first_date = np.datetime64(business_days.first_date, 'D')
+        offsets = (values - first_date).astype(np.int64)
+        next_offsets = business_days.next_offsets[offsets]
+        previous_offsets = business_days.previous_offsets[offsets]
+
+        if (next_offsets < 0).any() or (previous_offsets < 0).any():
+            return np.array([self.get_calculated_business_day(value, adjustment) for value in values.tolist()],
+                            dtype='datetime64[D]')
+
+        next_dates = first_date + next_offsets
+        previous_dates = first_date + previous_offsets
+
+        if adjustment == BusinessDayCalculation.PREVIOUS_BUSINESS_DAY:
+            return previous_dates
+
+        if adjustment == BusinessDayCalculation.NEXT_BUSINESS_DAY:
+            return next_dates
+
+        if adjustment == BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT:
+            return np.where(values - previous_dates < next_dates - values, previous_dates, next_dates)
+
+        return np.where(next_dates.astype('datetime64[M]') == values.astype('datetime64[M]'), next_dates,
+                        previous_dates)
+
     def __holidays_map(self):
         if self.holidays_map is None:
             self.holidays_map = {holiday.value: holiday for holiday in self.holidays}
@@ -530,13 +1399,99 @@ class Calendar(BaseModel):
         return previous_business_day
 
     def get_previous_business_day(self, date: date):
+        business_days = self.__get_business_days(date, date)
+        offset = int(business_days.previous_offsets[(date - business_days.first_date).days])
+
+        if offset >= 0:
+            return business_days.first_date + timedelta(days=offset)
+
         while not self.is_business_day(date):
             date = date - timedelta(days=1)
 
         return date
 
     def get_next_business_day(self, date: date):
+        business_days = self.__get_business_days(date, date)
+        offset = int(business_days.next_offsets[(date - business_days.first_date).days])
+
+        if offset >= 0:
+            return business_days.first_date + timedelta(days=offset)
+
         while not self.is_business_day(date):
             date = date + timedelta(days=1)
 
         return date
+
+
+class CalendarRegistry:
+    # calendars shared by the schedules of a process, and schedule dates adjusted to them, so that schedules with
+    # the same parameters adjust their dates once
+    ADJUSTMENTS = {BusinessDayAdjustment.NEXT_WORKING_DAY: BusinessDayCalculation.NEXT_BUSINESS_DAY,
+                   BusinessDayAdjustment.PREVIOUS_WORKING_DAY: BusinessDayCalculation.PREVIOUS_BUSINESS_DAY,
+                   BusinessDayAdjustment.CLOSEST_WORKING_DAY: BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT}
+
+    def __init__(self, max_size: int = 1024):
+        self.calendars: dict[str, Calendar] = {}
+        self.max_size = max_size
+        self._adjusted: OrderedDict[tuple, tuple[np.ndarray, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, calendar: Calendar) -> Calendar:
+        with self._lock:
+            self.calendars[calendar.name] = calendar
+            for key in [key for key in self._adjusted.keys() if key[0][0] == calendar.name]:
+                del self._adjusted[key]
+
+        schedule_dates_cache.discard_calendar(calendar.name)
+
+        return calendar
+
+    def get(self, name: Optional[str] = None) -> Calendar:
+        if name is None:
+            calendar = next((calendar for calendar in self.calendars.values() if calendar.is_default), None)
+            if calendar is None:
+                raise ValueError('No default calendar is registered')
+            return calendar
+
+        if name not in self.calendars:
+            raise ValueError(f'Calendar {name} is not registered')
+
+        return self.calendars[name]
+
+    def get_key(self, name: Optional[str] = None) -> tuple:
+        # identifies a calendar by its name and holiday dates in cache keys
+        calendar = self.get(name)
+        return calendar.name, tuple(sorted(holiday.value for holiday in calendar.holidays))
+
+    def get_adjusted(self, calendar_name: Optional[str], adjustment: BusinessDayAdjustment, key: tuple,
+                     generate: Callable[[], tuple[np.ndarray, bool]]) -> tuple[np.ndarray, bool]:
+        # dates generated for key and whether they are complete, adjusted to the calendar
+        calendar = self.get(calendar_name)
+        cache_key = (self.get_key(calendar_name), adjustment, key)
+
+        with self._lock:
+            adjusted = self._adjusted.get(cache_key)
+            if adjusted is not None:
+                self._adjusted.move_to_end(cache_key)
+                return adjusted
+
+        dates, complete = generate()
+        dates = np.unique(calendar.adjust_many(dates, self.ADJUSTMENTS[adjustment]))
+        # shared by all schedules with the same parameters
+        dates.flags.writeable = False
+        adjusted = (dates, complete)
+
+        with self._lock:
+            self._adjusted[cache_key] = adjusted
+            while len(self._adjusted) > self.max_size:
+                self._adjusted.popitem(last=False)
+
+        return adjusted
+
+    def clear(self):
+        with self._lock:
+            self.calendars.clear()
+            self._adjusted.clear()
+
+
+calendar_registry = CalendarRegistry()
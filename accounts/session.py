@@ -18,6 +18,11 @@ class SessionData:
     def get_session_info():
         return getattr(SessionData._thread_local, 'session_info', None)
 
+    @staticmethod
+    def clear_session_info():
+        if hasattr(SessionData._thread_local, 'session_info'):
+            del SessionData._thread_local.session_info
+
     @staticmethod
     def update_session_info(**kwargs):
         if hasattr(SessionData._thread_local, 'session_info'):
@@ -8,6 +8,29 @@ class CustomEncoder:
         return obj
 
 
+class DerivedState:
+    # values derived from the fields of a model, e.g. lookup maps, kept in a private attribute of it: unset values
+    # are None, copies start empty and any two compare equal, so they never change how models compare
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return None
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, DerivedState)
+
+    __hash__ = None
+
+    def __copy__(self):
+        return type(self)()
+
+    def __deepcopy__(self, memo: dict):
+        return type(self)()
+
+    def __reduce__(self):
+        return type(self), ()
+
+
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if obj is None or (isinstance(obj, (list, dict)) and not obj):
@@ -0,0 +1,244 @@
+import argparse
+import gc
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from accounts.accounts import Base, AccountData, PositionData, TransactionData
+from accounts.batch import BatchValuation
+from accounts.repository import SQLAlchemyAccountRepository
+from accounts.runtime import Account, AccountValuation, ExternalTransaction, ForecastEngine, InstalmentSolver, \
+    Schedule, group_by_date, schedule_dates_cache
+from tests.test_config import create_savings_account, create_savings_account_instance, create_loan_given_account
+from tests.test_loanGiven import create_loan_account
+
+# usage: python -m benchmarks.run [--filter forecast] [--repeat 5] [--output results.json] [--compare baseline.json]
+
+START_DATE = date(2019, 1, 1)
+LOAN_START_DATE = date(2013, 3, 8)
+
+# name -> (function creating the run callable for params, parameter grid)
+BENCHMARKS: dict[str, tuple[Callable[..., Callable[[], None]], dict[str, list]]] = {}
+
+
+def benchmark(name: str, **grid: list):
+    def register(setup: Callable[..., Callable[[], None]]):
+        BENCHMARKS[name] = (setup, grid)
+        return setup
+
+    return register
+
+
+def create_savings_accounts(count: int) -> list[tuple[Account, dict]]:
+    account_type = create_savings_account()
+    accounts = []
+
+    for i in range(count):
+        account = create_savings_account_instance(account_type, START_DATE)
+        deposit = ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000 + 10 * i),
+                                      value_date=START_DATE)
+        accounts.append((account, group_by_date([deposit])))
+
+    return accounts
+
+
+@benchmark("forecast_savings", years=[1, 10, 25], engine=[e.value for e in ForecastEngine])
+def forecast_savings(years: int, engine: str):
+    account_type = create_savings_account()
+    (account, external_transactions), = create_savings_accounts(1)
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=START_DATE,
+                                 engine=ForecastEngine(engine))
+
+    def run():
+        valuation.init_account()
+        valuation.forecast(START_DATE + relativedelta(years=years), external_transactions)
+
+    return run
+
+
+@benchmark("forecast_loan", years=[1, 10, 25], engine=[e.value for e in ForecastEngine])
+def forecast_loan(years: int, engine: str):
+    account_type = create_loan_given_account()
+    account, _ = create_loan_account(account_type, LOAN_START_DATE)
+    account.apply_calculated_installment(Decimal("2964.37"))
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=LOAN_START_DATE,
+                                 engine=ForecastEngine(engine))
+
+    def run():
+        valuation.init_account()
+        valuation.forecast(LOAN_START_DATE + relativedelta(years=years), {})
+
+    return run
+
+
+@benchmark("solve_instalment", solver=[s.value for s in InstalmentSolver])
+def solve_instalment(solver: str):
+    account_type = create_loan_given_account()
+    account, end_date = create_loan_account(account_type, LOAN_START_DATE)
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date,
+                                 instalment_solver=InstalmentSolver(solver))
+
+    return valuation.solve_instalment
+
+
+@benchmark("schedule_get_all_dates", years=[1, 10, 25], frequency=["DAILY", "MONTHLY"])
+def schedule_get_all_dates(years: int, frequency: str):
+    account_type = create_loan_given_account()
+    account, _ = create_loan_account(account_type, LOAN_START_DATE)
+    schedule: Schedule = account.schedules["accrual" if frequency == "DAILY" else "redemption"]
+    to_date = LOAN_START_DATE + relativedelta(years=years)
+
+    def run():
+        # dates are generated again on every run
+        schedule.cached_dates = None
+        schedule_dates_cache.clear()
+        schedule.get_all_dates(to_date)
+
+    return run
+
+
+@benchmark("batch_forecast_savings", accounts=[1, 10, 100])
+def batch_forecast_savings(accounts: int):
+    account_type = create_savings_account()
+
+    def run():
+        portfolio = create_savings_accounts(accounts)
+        BatchValuation(account_type, START_DATE).forecast(START_DATE + relativedelta(years=1),
+                                                          [account for account, _ in portfolio],
+                                                          [transactions for _, transactions in portfolio])
+
+    return run
+
+
+@benchmark("sqlite_bulk_create_transactions", accounts=[1, 10])
+def sqlite_bulk_create_transactions(accounts: int):
+    account_type = create_savings_account()
+    portfolio = create_savings_accounts(accounts)
+
+    for account, external_transactions in portfolio:
+        AccountValuation(account=account, account_type=account_type, action_date=START_DATE) \
+            .forecast(START_DATE + relativedelta(years=1), external_transactions)
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    repository = SQLAlchemyAccountRepository(session)
+
+    for index in range(accounts):
+        repository.create_account(AccountData(account_number=str(index), additional_info={}), [], [])
+
+    def run():
+        session.query(TransactionData).delete()
+        session.query(PositionData).delete()
+        session.commit()
+
+        for index, (account, _) in enumerate(portfolio):
+            positions = [PositionData(account_number=str(index), position_type=name, amount=position.amount,
+                                      additional_info={}) for name, position in account.positions.items()]
+            transactions = [TransactionData(account_number=str(index), transaction_type=t.transaction_type,
+                                            amount=t.amount, action_date=t.action_date, value_date=t.value_date,
+                                            system_generated=t.system_generated, additional_info={})
+                            for t in account.transactions]
+            repository.bulk_create_transactions(positions, transactions)
+
+    return run
+
+
+def measure(setup: Callable[..., Callable[[], None]], params: dict, repeat: int) -> dict:
+    run = setup(**params)
+    run()  # warm up caches, e.g. compiled expressions and schedule dates
+
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat, "peak_memory": peak}
+
+
+def run_benchmarks(name_filter: Optional[str], repeat: int) -> list[dict]:
+    results = []
+
+    for name, (setup, grid) in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+
+        for values in itertools.product(*grid.values()):
+            params = dict(zip(grid.keys(), values))
+            result = {"name": name, "params": params, **measure(setup, params, repeat)}
+            results.append(result)
+            print(f"{get_key(result):60} {result['median'] * 1000:10.1f} ms {result['peak_memory'] / 1024:10.0f} KiB",
+                  file=sys.stderr)
+
+    return results
+
+
+def get_key(result: dict) -> str:
+    return result["name"] + "".join(f" {key}={value}" for key, value in result["params"].items())
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline: dict):
+    # ratio of median times, above 1 is slower than the baseline
+    baseline_results = {get_key(result): result for result in baseline["results"]}
+
+    for result in results:
+        previous = baseline_results.get(get_key(result))
+        if previous:
+            print(f"{get_key(result):60} {result['median'] / previous['median']:6.2f}x time "
+                  f"{result['peak_memory'] / max(previous['peak_memory'], 1):6.2f}x memory", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of forecasts, instalment solving and repositories")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file to write JSON results to, default is stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    report = {"commit": get_commit(),
+              "created": datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": run_benchmarks(args.filter, args.repeat)}
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report["results"], json.load(file))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from accounts.batch import BatchValuation
+from accounts.runtime import AccountValuation, TransactionStorage
+from tests.test_config import create_savings_account, create_loan_given_account
+from tests.test_loanGiven import create_loan_account
+from tests.test_portfolio import create_account
+
+
+class TestBatchValuation(unittest.TestCase):
+
+    def assert_scalar_results(self, account_type, accounts, external_transactions, action_date, to_value_date,
+                              transaction_storage=TransactionStorage.MODELS):
+        expected = [account.model_copy(deep=True) for account in accounts]
+
+        valuation = BatchValuation(account_type, action_date, transaction_storage)
+        valuation.forecast(to_value_date, accounts, external_transactions)
+
+        for account, expected_account, transactions in zip(accounts, expected, external_transactions):
+            AccountValuation(account=expected_account, account_type=account_type, action_date=action_date) \
+                .forecast(to_value_date, transactions)
+
+            self.assertEqual(expected_account.transactions, account.get_transactions())
+            self.assertEqual(expected_account.positions, account.positions)
+
+        return valuation
+
+    def test_savings_accounts(self):
+        account_type = create_savings_account()
+        accounts, external_transactions = zip(*(create_account(account_type, Decimal(1000 * (i + 1)))
+                                                for i in range(5)))
+
+        for transaction_storage in TransactionStorage:
+            valuation = self.assert_scalar_results(account_type, [a.model_copy(deep=True) for a in accounts],
+                                                   list(external_transactions), date(2020, 1, 1), date(2020, 1, 1),
+                                                   transaction_storage)
+
+            self.assertEqual(5, valuation.batched_accounts)
+
+    def test_loan_accounts(self):
+        account_type = create_loan_given_account()
+        accounts = []
+
+        for i in range(3):
+            account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+            account.apply_calculated_installment(Decimal(2964.37) + i)
+            account.properties["advance"] = 624000 + 1000 * i
+            accounts.append(account)
+
+        valuation = self.assert_scalar_results(account_type, accounts, [{} for _ in accounts], end_date,
+                                               end_date + relativedelta(days=1))
+
+        self.assertEqual(3, valuation.batched_accounts)
+
+    def test_scalar_fallback(self):
+        account_type = create_savings_account()
+        account_type.scheduled_transactions[0].amount_expression = "max(account.monthlyFee[value_date], Decimal(0))"
+        accounts, external_transactions = zip(*(create_account(account_type, Decimal(1000 * (i + 1)))
+                                                for i in range(3)))
+
+        valuation = self.assert_scalar_results(account_type, list(accounts), list(external_transactions),
+                                               date(2020, 1, 1), date(2020, 1, 1))
+
+        self.assertEqual((0, 3), (valuation.batched_accounts, valuation.scalar_accounts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from datetime import date
+from datetime import date, timedelta
 
 from accounts.runtime import BusinessDayCalculation
 from tests.test_config import get_euro_calendar
@@ -48,3 +48,18 @@ class TestCalendar(unittest.TestCase):
                          calendar.get_calculated_business_day(date(2019, 9, 29),
                                                               BusinessDayCalculation.
                                                               ANY_DAY))  # no adjustment, non-working day is ok
+
+    def test_adjust_many(self):
+        calendar = get_euro_calendar().precompute(date(2019, 1, 1), date(2019, 12, 31))
+        dates = [date(2018, 12, 1) + timedelta(days=i) for i in range(500)]
+
+        for adjustment in BusinessDayCalculation:
+            expected = [calendar.get_calculated_business_day(value, adjustment) for value in dates]
+            self.assertEqual(expected, calendar.adjust_many(dates, adjustment).tolist())
+
+        self.assertEqual(date(2020, 4, 23), calendar.get_next_business_day(date(2020, 4, 23)))
+        calendar.add("HOLIDAY", date(2020, 4, 23))
+        self.assertEqual(date(2020, 4, 24), calendar.get_next_business_day(date(2020, 4, 23)))
+
+        # precomputed business days do not change how calendars compare
+        self.assertEqual(get_euro_calendar().add("HOLIDAY", date(2020, 4, 23)), calendar)
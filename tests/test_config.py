@@ -1,5 +1,5 @@
 from accounts.metadata import *
-from accounts.runtime import Calendar
+from accounts.runtime import Account, Calendar, PropertyValue
 
 
 def create_savings_account() -> AccountType:
@@ -67,6 +67,14 @@ def create_savings_account() -> AccountType:
     return acc
 
 
+def create_savings_account_instance(account_type: AccountType, start_date: date = date(2019, 1, 1),
+                                    monthly_fee: Decimal = Decimal(1),
+                                    withholding_tax: Decimal = Decimal(0.2)) -> Account:
+    return Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                   properties={"monthlyFee": PropertyValue(value={start_date: monthly_fee}),
+                               "withholdingTax": PropertyValue(value={start_date: withholding_tax})})
+
+
 def create_loan_given_account() -> AccountType:
     loan_given = AccountType(name="Loan", label="Loan")
 
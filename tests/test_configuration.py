@@ -27,6 +27,44 @@ class TestConfiguration(unittest.TestCase):
         self.assertEqual(text, text2)
 
 
+    def test_invalid_expression(self):
+        account_type = create_savings_account()
+
+        with self.assertRaises(ValueError):
+            AccountType(**account_type.model_dump(exclude={"triggered_transactions"}),
+                        triggered_transactions=[TriggeredTransaction(trigger_transaction_type_name="capitalized",
+                                                                     generated_transaction_type="withholdingTax",
+                                                                     amount_expression="transaction.amount *")])
+
+    def test_compiled_expression_is_cached(self):
+        account_type = create_savings_account()
+
+        compiled = account_type.compile_expressions()
+
+        self.assertEqual(set(account_type.get_expressions()), set(compiled.keys()))
+        self.assertIs(compiled["account.accrued"], compile_expression("account.accrued"))
+
+    def test_lookup_maps(self):
+        account_type = create_savings_account()
+
+        self.assertEqual("deposit", account_type.get_transaction_type("deposit").name)
+        self.assertEqual("withholdingTax", account_type.get_trigger_transaction("capitalized").generated_transaction_type)
+        self.assertIsNone(account_type.get_trigger_transaction("deposit"))
+        self.assertEqual("accrual", account_type.get_schedule_type("accrual").name)
+
+        account_type.add_transaction_type("withdrawal", "Withdrawal")
+
+        self.assertEqual("withdrawal", account_type.get_transaction_type("withdrawal").name)
+        self.assertNotIn("lookups", account_type.model_dump_json())
+
+        # looking up types does not change how account types compare
+        other = create_savings_account()
+        other.add_transaction_type("withdrawal", "Withdrawal")
+        self.assertEqual(other, account_type)
+        self.assertEqual(account_type, account_type.model_copy(deep=True))
+        self.assertEqual("deposit", account_type.model_copy().get_transaction_type("deposit").name)
+
+
 class RateTest(unittest.TestCase):
     def test_get_max_when_empy(self):
         rate_type = RateType(name='rates', label='Rates')
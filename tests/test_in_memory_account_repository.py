@@ -1,4 +1,5 @@
 import unittest
+from datetime import date
 from accounts.accounts import AccountData, PositionData, TransactionData
 from accounts.repository import InMemoryAccountRepository
 
@@ -34,6 +35,35 @@ class TestInMemoryAccountRepository(unittest.TestCase):
         self.assertEqual(len(account_data["positions"]), 1)
         self.assertEqual(len(account_data["transactions"]), 1)
 
+    def test_create_transactions_updates_positions_per_account(self):
+        for account_number in ("123", "456"):
+            account = AccountData(account_number=account_number, additional_info={})
+            positions = [PositionData(account_number=account_number, position_type="type1", amount=100,
+                                      additional_info={})]
+            self.repo.create_account(account, positions, [])
+        positions = [PositionData(account_number="123", position_type="type1", amount=200, additional_info={})]
+        transactions = [TransactionData(account_number="123", transaction_type="type1", amount=100, additional_info={})]
+        self.repo.create_transactions(positions, transactions)
+        account_data = self.repo.get_account_data("123")
+        self.assertEqual(1, len(account_data["positions"]))
+        self.assertEqual(200, account_data["positions"][0].amount)
+        self.assertEqual(1, len(account_data["transactions"]))
+        account_data = self.repo.get_account_data("456")
+        self.assertEqual(100, account_data["positions"][0].amount)
+        self.assertEqual(0, len(account_data["transactions"]))
+
+    def test_iter_transactions(self):
+        account = AccountData(account_number="123", additional_info={})
+        transactions = [TransactionData(account_number="123", transaction_type="type1", amount=i,
+                                        value_date=date(2019, 1, 10 - i), additional_info={}) for i in range(5)]
+        self.repo.create_account(account, [], transactions)
+        value_dates = [t.value_date for t in self.repo.iter_transactions("123", batch_size=2)]
+        self.assertEqual([date(2019, 1, day) for day in range(6, 11)], value_dates)
+        value_dates = [t.value_date for t in self.repo.iter_transactions("123", from_value_date=date(2019, 1, 7),
+                                                                         to_value_date=date(2019, 1, 9))]
+        self.assertEqual([date(2019, 1, 7), date(2019, 1, 8), date(2019, 1, 9)], value_dates)
+        self.assertEqual([], list(self.repo.iter_transactions("456")))
+
     def test_get_account_data(self):
         account = AccountData(account_number="123", additional_info={})
         positions = [PositionData(account_number="123", position_type="type1", amount=100, additional_info={})]
@@ -1,5 +1,7 @@
 import unittest
-from accounts.configuration import ConfigurationData
+from datetime import date
+from accounts.configuration import ConfigurationData, ConfigurationCache
+from accounts.session import SessionData
 from accounts.repository import InMemoryConfigurationRepository
 
 class TestInMemoryConfigurationRepository(unittest.TestCase):
@@ -38,5 +40,22 @@ class TestInMemoryConfigurationRepository(unittest.TestCase):
         all_configs = self.repo.get_all_configurations()
         self.assertEqual(len(all_configs), 2)
 
+    def test_get_latest_configuration_cached(self):
+        SessionData.set_session_info("tenant1", date(2025, 1, 1), date(2025, 1, 1), "user1", "User 1")
+        self.addCleanup(SessionData.clear_session_info)
+        cache = ConfigurationCache(max_size=2)
+        repo = InMemoryConfigurationRepository(cache)
+        repo.save(ConfigurationData(name="config1", label="Config 1", version=1, account_types=[], tenant_name="tenant1"))
+
+        configuration = repo.get_latest_configuration("config1")
+        self.assertIs(repo.get_latest_configuration("config1"), configuration)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        repo.save(ConfigurationData(name="config1", label="Config 1 Updated", version=1, account_types=[], tenant_name="tenant1"))
+        latest = repo.get_latest_configuration("config1")
+        self.assertEqual((latest.version, latest.label), (2, "Config 1 Updated"))
+        self.assertEqual(cache.misses, 2)
+        self.assertIsNone(repo.get_latest_configuration("config2"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -4,7 +4,8 @@ from decimal import Decimal
 
 from dateutil.relativedelta import relativedelta
 from accounts.metadata import AccountType
-from accounts.runtime import Account, PropertyValue, AccountValuation, Schedule
+from accounts.runtime import Account, PropertyValue, AccountValuation, Schedule, ForecastEngine, InstalmentSolver, \
+    Instalment
 from tests.test_config import create_loan_given_account
 
 
@@ -118,6 +119,22 @@ class TestConfiguration(unittest.TestCase):
         self.assertAlmostEqual(Decimal(709778.93), account.positions["interest_capitalized"].amount, places=2)
         self.assertAlmostEqual(Decimal(0.005), account.positions["accrued"].amount, places=2)
 
+    def test_event_driven_forecast(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+        account.apply_calculated_installment(Decimal(2964.37))
+        event_account = account.model_copy(deep=True)
+
+        AccountValuation(account=account, account_type=account_type, action_date=end_date) \
+            .forecast(end_date + relativedelta(days=1), {})
+        AccountValuation(account=event_account, account_type=account_type, action_date=end_date,
+                         engine=ForecastEngine.EVENT_DRIVEN) \
+            .forecast(end_date + relativedelta(days=1), {})
+
+        self.assertEqual(account.transactions, event_account.transactions)
+        self.assertEqual(account.positions, event_account.positions)
+
     def test_installments(self):
         account_type = create_loan_given_account()
 
@@ -128,3 +145,42 @@ class TestConfiguration(unittest.TestCase):
         payment = valuation.solve_instalment()
 
         self.assertAlmostEqual(Decimal(2964.37), Decimal(payment), places=2)
+
+    def test_fixed_installment(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+        self.assertEqual({}, account.instalments)
+
+        fixed_date = account.get_instalment_dates("redemption", account.start_date, end_date)[0]
+        account.instalments[fixed_date] = Instalment(amount=Decimal(100000), is_fixed=True)
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date)
+        payment = valuation.solve_instalment()
+
+        self.assertLess(payment, Decimal(2964.37))
+        self.assertEqual(payment, account.instalment_amount)
+        self.assertEqual(Decimal(100000), account.instalments[fixed_date].amount)
+
+        valuation.init_account()
+        valuation.forecast(end_date, {})
+        redemptions = [t for t in account.get_transactions() if t.transaction_type == "redemption"]
+
+        self.assertEqual((fixed_date, Decimal(100000)), (redemptions[0].value_date, redemptions[0].amount))
+        self.assertEqual(payment, redemptions[1].amount)
+
+    def test_installments_secant(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date,
+                                     instalment_solver=InstalmentSolver.SECANT, solver_log_size=2)
+
+        payment = valuation.solve_instalment()
+
+        self.assertAlmostEqual(Decimal(2964.37), payment, places=2)
+        self.assertLessEqual(valuation.solver_forecasts, 4)
+        self.assertEqual(2, len(valuation.solver_log))
+        self.assertLess(abs(valuation.solver_log[-1].residual), Decimal(1))
+        self.assertEqual((end_date - account.start_date).days, valuation.solver_log[-1].forecast_days)
@@ -0,0 +1,65 @@
+import multiprocessing
+import unittest
+from datetime import date
+from decimal import Decimal
+
+from accounts.portfolio import PortfolioValuation
+from accounts.metadata import BusinessDayAdjustment
+from accounts.runtime import Account, ExternalTransaction, group_by_date, ForecastEngine, \
+    calendar_registry
+from tests.test_config import create_savings_account, create_savings_account_instance, get_euro_calendar
+from tests.test_runtime import evaluate_account
+
+
+def create_account(account_type, deposit: Decimal) -> (Account, dict):
+    start_date = date(2019, 1, 1)
+    account = create_savings_account_instance(account_type, start_date)
+    external_transactions = group_by_date([
+        ExternalTransaction(transaction_type_name="deposit", amount=deposit, value_date=start_date)])
+
+    return account, external_transactions
+
+
+class TestPortfolioValuation(unittest.TestCase):
+
+    def test_forecast(self):
+        account_type = create_savings_account()
+        deposits = [Decimal(1000 * (i + 1)) for i in range(7)]
+
+        portfolio = PortfolioValuation(account_type, date(2020, 1, 1), max_workers=2, chunk_size=3,
+                                       engine=ForecastEngine.EVENT_DRIVEN)
+
+        results = dict(portfolio.forecast(date(2020, 1, 1),
+                                          (create_account(account_type, deposit) for deposit in deposits)))
+
+        self.assertEqual(list(range(len(deposits))), sorted(results.keys()))
+
+        for index, deposit in enumerate(deposits):
+            expected = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=deposit,
+                                        withholding_tax=Decimal(0.2))
+
+            self.assertEqual(expected.positions, results[index].positions)
+            self.assertEqual(expected.transactions, results[index].transactions)
+
+    def test_forecast_with_calendar(self):
+        calendar_registry.register(get_euro_calendar())
+        self.addCleanup(calendar_registry.clear)
+
+        account_type = create_savings_account()
+        account_type.get_schedule_type("compounding").business_day_adjustment = \
+            BusinessDayAdjustment.NEXT_WORKING_DAY
+
+        # spawned workers only know the calendars passed by the pool initializer
+        portfolio = PortfolioValuation(account_type, date(2020, 1, 1), max_workers=1,
+                                       mp_context=multiprocessing.get_context("spawn"))
+
+        (_, account), = portfolio.forecast(date(2020, 1, 1), [create_account(account_type, Decimal(1000))])
+        expected = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                    withholding_tax=Decimal(0.2))
+
+        self.assertEqual(expected.positions, account.positions)
+        self.assertEqual(expected.transactions, account.transactions)
+
+
+if __name__ == '__main__':
+    unittest.main()
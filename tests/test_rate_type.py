@@ -22,6 +22,27 @@ class TestRateType(unittest.TestCase):
 
         self.assertEqual(payment_rates.get_rate(self.value_date, Decimal(0.000000001)), Decimal(0))
 
+    def test_get_rate_effective_dates(self):
+        rates = RateType(name="interest", label="Interest")
+
+        rates.add_tier(date(2019, 1, 1), Decimal(1000), Decimal(1))
+        rates.add_tier(date(2019, 1, 1), Decimal(5000), Decimal(2))
+        rates.add_tier(date(2020, 1, 1), Decimal(1000), Decimal(3))
+
+        self.assertEqual(Decimal(1), rates.get_rate(date(2019, 6, 1), Decimal(1000)))
+        self.assertEqual(Decimal(2), rates.get_rate(date(2019, 12, 31), Decimal(1000.01)))
+        self.assertEqual(Decimal(3), rates.get_rate(date(2020, 1, 1), Decimal(500)))
+        self.assertEqual(Decimal(0), rates.get_rate(date(2020, 1, 1), Decimal(-1)))
+        self.assertRaises(Exception, rates.get_rate, date(2018, 12, 31), Decimal(500))
+        self.assertRaises(Exception, rates.get_rate, date(2020, 1, 1), Decimal(1500))
+
+        rates.add_tier(date(2020, 1, 1), Decimal(2000), Decimal(4))
+
+        self.assertEqual(Decimal(4), rates.get_rate(date(2020, 1, 1), Decimal(1500)))
+
+        # looking up rates does not change how rate types compare
+        self.assertEqual(RateType(name="interest", label="Interest", rate_tiers=rates.rate_tiers), rates)
+
     def test_get_fee_success(self):
         self.assertEqual(self.payment_rates.get_fee(self.value_date, Decimal(0), Decimal(5)), Decimal(0))
         self.assertEqual(self.payment_rates.get_fee(self.value_date, Decimal(5), Decimal(15)), Decimal(25))
@@ -1,18 +1,17 @@
 import unittest
 
+from accounts.instrumentation import ProfilingInstrumentation, ValuationPhase
 from accounts.runtime import *
-from tests.test_config import create_savings_account
+from tests.test_config import create_savings_account, create_savings_account_instance
 
 
 def evaluate_account(account_type: AccountType, monthly_fee: Decimal, deposit: Decimal,
-                     withholding_tax: Decimal) -> Account:
-    start_date = date(2019, 1, 1)
-    account = Account(start_date=start_date, account_type_name=account_type.name,
-                      account_type=account_type,
-                      properties={"monthlyFee": PropertyValue(value={start_date: monthly_fee}),
-                                  "withholdingTax": PropertyValue(value={start_date: withholding_tax})})
+                     withholding_tax: Decimal, engine: ForecastEngine = ForecastEngine.DAILY,
+                     accrual_aggregation: AccrualAggregation = AccrualAggregation.NONE) -> Account:
+    account = create_savings_account_instance(account_type, monthly_fee=monthly_fee, withholding_tax=withholding_tax)
 
-    valuation = AccountValuation(account= account, account_type= account_type, action_date= date(2020, 1, 1))
+    valuation = AccountValuation(account= account, account_type= account_type, action_date= date(2020, 1, 1),
+                                 engine=engine, accrual_aggregation=accrual_aggregation)
     deposit_transaction_type = account_type.get_transaction_type("deposit")
     external_transactions = group_by_date([
         ExternalTransaction(transaction_type_name=deposit_transaction_type.name,
@@ -88,6 +87,30 @@ class TestAccount(unittest.TestCase):
         self.assertAlmostEqual(account.positions['withholding'].amount, Decimal(6.05), places=4)
         self.assertAlmostEqual(account.transactions[1].amount, Decimal(0.08219), places=4)
 
+    def test_position_reads_while_forecasting(self):
+        account_type = create_savings_account()
+        expected = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                    withholding_tax=Decimal(0.2))
+
+        account_type = create_savings_account()
+        account_type.scheduled_transactions[1].amount_expression = \
+            "account.positions['current'].amount * accountType.interest.get_rate(value_date, account.current) / " \
+            "Decimal(365)"
+        account = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                   withholding_tax=Decimal(0.2))
+
+        self.assertEqual(expected.transactions, account.transactions)
+        self.assertIsInstance(account.positions['current'], Position)
+        self.assertEqual(expected.positions, account.positions)
+
+    def test_missing_calendar(self):
+        account_type = create_savings_account()
+        account_type.get_schedule_type("compounding").business_day_adjustment = \
+            BusinessDayAdjustment.NEXT_WORKING_DAY
+
+        with self.assertRaisesRegex(ValueError, "No default calendar is registered"):
+            create_savings_account_instance(account_type)
+
     def test_valuation_difference(self):
         account_type = create_savings_account()
 
@@ -112,6 +135,123 @@ class TestAccount(unittest.TestCase):
         self.assertEqual(0, len(fee.new))
         self.assertAlmostEqual(Decimal(-0.26), withholding.amount, 2)
 
+    def test_event_driven_valuation(self):
+        account_type = create_savings_account()
+
+        daily = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                 withholding_tax=Decimal(0.2))
+        event_driven = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                        withholding_tax=Decimal(0.2), engine=ForecastEngine.EVENT_DRIVEN)
+
+        self.assertEqual(daily.transactions, event_driven.transactions)
+        self.assertEqual(daily.positions, event_driven.positions)
+
+    def test_accrual_aggregation(self):
+        account_type = create_savings_account()
+
+        daily = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                 withholding_tax=Decimal(0.2))
+
+        for accrual_aggregation in (AccrualAggregation.SUMMARIZED, AccrualAggregation.DAILY):
+            aggregated = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                          withholding_tax=Decimal(0.2), accrual_aggregation=accrual_aggregation)
+
+            for name, position in daily.positions.items():
+                self.assertAlmostEqual(position.amount, aggregated.positions[name].amount, places=10)
+
+            accrued = [t for t in aggregated.transactions if t.transaction_type == 'interestAccrued']
+
+            if accrual_aggregation == AccrualAggregation.DAILY:
+                self.assertEqual(365, len(accrued))
+                self.assertEqual(len(daily.transactions), len(aggregated.transactions))
+            else:
+                # deposit date and 12 compounding dates are posted daily, plus one accrual for each span in between
+                self.assertEqual(25, len(accrued))
+
+    def test_columnar_transaction_storage(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        deposit = ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)
+
+        expected = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                    withholding_tax=Decimal(0.2))
+
+        accounts = []
+        for _ in range(2):
+            account = create_savings_account_instance(account_type, start_date)
+            valuation = AccountValuation(account=account, account_type=account_type, action_date=date(2020, 1, 1),
+                                         transaction_storage=TransactionStorage.COLUMNAR,
+                                         checkpoint_interval=CheckpointInterval.MONTH_END)
+            valuation.forecast(date(2020, 1, 1), group_by_date([deposit]))
+            accounts.append(account)
+
+        self.assertEqual(accounts[0], accounts[1])
+
+        self.assertEqual([], account.transactions)
+        self.assertEqual(len(expected.transactions), len(account.transaction_log))
+        self.assertEqual(expected.transactions, account.get_transactions())
+        self.assertEqual(expected.transactions[-1], account.transaction_log[-1])
+        self.assertEqual(expected.positions, account.positions)
+
+        difference = valuation.revalue_from(date(2019, 6, 15), group_by_date([deposit]))
+
+        self.assertEqual({}, difference)
+        self.assertEqual(expected.transactions, account.get_transactions())
+
+    def test_instrumentation(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        instrumentation = ProfilingInstrumentation()
+
+        for deposit in (Decimal(1000), Decimal(2000)):
+            account = create_savings_account_instance(account_type, start_date)
+            AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                             instrumentation=instrumentation) \
+                .forecast(date(2020, 1, 1), group_by_date([ExternalTransaction(transaction_type_name="deposit",
+                                                                               amount=deposit,
+                                                                               value_date=start_date)]))
+
+        statistics = {(s.phase, s.name): s for s in instrumentation.report()}
+        accrual_expression = account_type.scheduled_transactions[1].amount_expression
+
+        self.assertEqual(2, statistics[(ValuationPhase.FORECAST, account_type.name)].count)
+        self.assertEqual(2 * 365, statistics[(ValuationPhase.EXPRESSION, accrual_expression)].count)
+        self.assertEqual(2 * 365, statistics[(ValuationPhase.SCHEDULE_DUE_CHECK, "accrual")].count)
+        self.assertEqual(2 * 12, statistics[(ValuationPhase.TRIGGER, "capitalized -> withholdingTax")].count)
+        self.assertEqual(2, statistics[(ValuationPhase.POSITION_UPDATE, "deposit")].count)
+        self.assertEqual(ValuationPhase.FORECAST, instrumentation.report()[0].phase)
+
+    def test_revalue_from_checkpoint(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        deposit = ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)
+        back_dated = ExternalTransaction(transaction_type_name="deposit", amount=Decimal(500),
+                                         value_date=date(2019, 6, 15))
+
+        expected = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                    withholding_tax=Decimal(0.2))
+        expected_valuation = AccountValuation(account=expected, account_type=account_type, action_date=start_date)
+        expected_valuation.init_account()
+        expected_valuation.forecast(date(2020, 1, 1), group_by_date([deposit, back_dated]))
+
+        for engine in ForecastEngine:
+            account = create_savings_account_instance(account_type)
+            valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                         engine=engine, checkpoint_interval=CheckpointInterval.MONTH_END)
+            valuation.forecast(date(2020, 1, 1), group_by_date([deposit]))
+
+            self.assertEqual(12, len(account.checkpoints))
+            self.assertEqual(date(2019, 1, 31), account.checkpoints[0].value_date)
+
+            difference = valuation.revalue_from(date(2019, 6, 15), group_by_date([deposit, back_dated]))
+
+            self.assertEqual(date(2019, 6, 15), min(difference.keys()))
+            self.assertEqual(Decimal(500), next(d.amount for d in difference[date(2019, 6, 15)]
+                                                if d.transaction_type == "deposit"))
+            self.assertEqual(expected.transactions, account.transactions)
+            self.assertEqual(expected.positions, account.positions)
+            self.assertEqual(12, len(account.checkpoints))
+
     def test_property_valuation(self):
         account_type = create_savings_account()
 
@@ -125,6 +265,28 @@ class TestAccount(unittest.TestCase):
         self.assertAlmostEqual(account.positions['withholding'].amount, Decimal(4.52), places=2)
         self.assertAlmostEqual(account.transactions[1].amount, Decimal(0.08219), places=4)
 
+    def test_property_value_lookup(self):
+        value_dates = [date(2019, 1, 1) + timedelta(days=10 * i) for i in range(50)]
+        property_value = PropertyValue(value={value_date: i for i, value_date in enumerate(reversed(value_dates))})
+
+        # increasing dates, then going back and jumping ahead
+        test_dates = [date(2019, 1, 1) + timedelta(days=i) for i in range(600)] + \
+                     [date(2019, 3, 5), date(2020, 2, 1), date(2019, 1, 1), date(2030, 1, 1)]
+        for test_date in test_dates:
+            expected = max(d for d in value_dates if d <= test_date)
+            self.assertEqual(property_value.value[expected], property_value[test_date])
+
+        property_value[date(2019, 1, 5)] = 100
+        self.assertEqual(100, property_value[date(2019, 1, 6)])
+        property_value.value = {date(2019, 1, 1): 200}
+        self.assertEqual(200, property_value[date(2030, 1, 1)])
+
+        with self.assertRaises(ValueError):
+            property_value[date(2018, 12, 31)]
+
+        # lookups do not change how property values compare
+        self.assertEqual(PropertyValue(value={date(2019, 1, 1): 200}), property_value)
+
 
 if __name__ == '__main__':
     unittest.main()
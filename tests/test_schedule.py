@@ -1,6 +1,7 @@
 import unittest
 
 from accounts.runtime import *
+from tests.test_config import get_euro_calendar
 
 
 class TestSchedule(unittest.TestCase):
@@ -77,6 +78,94 @@ class TestSchedule(unittest.TestCase):
         self.assertEqual(len(discount_dates), 3)
         self.assertEqual(date(2020, 2, 1), discount_dates[2])
 
+    def test_monthly_schedule_horizon(self):
+        schedule = Schedule(start_date=date(2020, 1, 31), end_type=ScheduleEndType.NO_END,
+                            frequency=ScheduleFrequency.MONTHLY, interval=2,
+                            exclude_dates=[date(2020, 5, 31)], include_dates=[date(2020, 6, 15)])
+
+        self.assertTrue(schedule.is_due(date(2020, 3, 31)))
+        self.assertFalse(schedule.is_due(date(2020, 5, 31)))
+        self.assertTrue(schedule.is_due(date(2020, 6, 15)))
+        self.assertFalse(schedule.is_due(date(2020, 4, 30)))
+
+        # dates past the generated horizon are added on demand
+        self.assertTrue(schedule.is_due(date(2070, 1, 31)))
+        self.assertTrue(schedule.is_due(date(2020, 9, 30)))
+
+        self.assertEqual([date(2020, 1, 31), date(2020, 3, 31), date(2020, 6, 15), date(2020, 7, 31)],
+                         schedule.get_all_dates(date(2020, 8, 31)))
+        self.assertEqual([date(2020, 6, 15), date(2020, 7, 31)],
+                         list(schedule.get_due_dates(date(2020, 4, 1), date(2020, 8, 31))))
+
+
+    def test_adjusted_schedule(self):
+        calendar = calendar_registry.register(get_euro_calendar())
+        self.addCleanup(calendar_registry.clear)
+
+        schedules = [Schedule(start_date=date(2019, 1, 31), end_type=ScheduleEndType.NO_END,
+                              frequency=ScheduleFrequency.MONTHLY, interval=1,
+                              adjustment=BusinessDayAdjustment.NEXT_WORKING_DAY) for _ in range(2)]
+
+        dates = schedules[0].get_all_dates(date(2019, 12, 31))
+
+        self.assertEqual(date(2019, 4, 1), dates[2])  # 31 March 2019 is a Sunday
+        self.assertEqual(date(2019, 12, 2), dates[-2])  # 30 November 2019 is a Saturday
+        self.assertEqual([calendar.get_calculated_business_day(value, BusinessDayCalculation.NEXT_BUSINESS_DAY)
+                          for value in Schedule(start_date=date(2019, 1, 31), end_type=ScheduleEndType.NO_END,
+                                                frequency=ScheduleFrequency.MONTHLY,
+                                                interval=1).get_all_dates(date(2019, 12, 31))], dates)
+        self.assertTrue(schedules[1].is_due(date(2019, 4, 1)))
+        self.assertFalse(schedules[1].is_due(date(2019, 3, 31)))
+
+        # schedules with the same parameters share their adjusted dates
+        self.assertIs(schedules[0].cached_dates.dates, schedules[1].cached_dates.dates)
+
+        with self.assertRaises(ValueError):
+            Schedule(start_date=date(2019, 1, 31), end_type=ScheduleEndType.NO_END,
+                     frequency=ScheduleFrequency.MONTHLY, interval=1, calendar_name="unknown",
+                     adjustment=BusinessDayAdjustment.NEXT_WORKING_DAY).is_due(date(2019, 4, 1))
+
+    def test_registered_calendar_changes(self):
+        schedule_dates_cache.clear()
+        self.addCleanup(calendar_registry.clear)
+        self.addCleanup(schedule_dates_cache.clear)
+
+        def get_adjusted_dates():
+            return Schedule(start_date=date(2019, 1, 31), end_type=ScheduleEndType.NO_END,
+                            frequency=ScheduleFrequency.MONTHLY, interval=1, calendar_name="test",
+                            adjustment=BusinessDayAdjustment.NEXT_WORKING_DAY).get_all_dates(date(2019, 6, 30))
+
+        # 31 March 2019 is a Sunday
+        calendar_registry.register(Calendar(name="test", is_default=False).add("holiday", date(2019, 4, 1)))
+        self.assertEqual(date(2019, 4, 2), get_adjusted_dates()[2])
+
+        # the same number of holidays on other dates
+        self.assertEqual(1, len(schedule_dates_cache))
+        calendar_registry.register(Calendar(name="test", is_default=False).add("holiday", date(2019, 4, 2)))
+        self.assertEqual(0, len(schedule_dates_cache))
+        self.assertEqual(date(2019, 4, 1), get_adjusted_dates()[2])
+
+    def test_shared_dates(self):
+        schedule_dates_cache.clear()
+        self.addCleanup(schedule_dates_cache.clear)
+
+        schedules = [Schedule(start_date=date(2019, 1, 31), end_type=ScheduleEndType.NO_END,
+                              frequency=ScheduleFrequency.MONTHLY, interval=1) for _ in range(3)]
+        schedules[2].exclude_dates.append(date(2019, 2, 28))
+
+        self.assertTrue(schedules[0].is_due(date(2019, 2, 28)))
+        self.assertTrue(schedules[1].is_due(date(2019, 3, 31)))
+        self.assertFalse(schedules[2].is_due(date(2019, 2, 28)))
+
+        self.assertIs(schedules[0].cached_dates, schedules[1].cached_dates)
+        self.assertIsNot(schedules[0].cached_dates, schedules[2].cached_dates)
+        self.assertEqual((1, 2), (schedule_dates_cache.hits, schedule_dates_cache.misses))
+
+        # a later date extends the horizon to a new entry shared by schedules asking for dates up to that horizon
+        self.assertEqual(date(2023, 1, 31), schedules[0].get_all_dates(date(2023, 1, 31))[-1])
+        schedules[1].get_all_dates(date(2022, 6, 30))
+        self.assertIs(schedules[0].cached_dates, schedules[1].cached_dates)
+        self.assertFalse(schedules[0].cached_dates.dates.flags.writeable)
 
 if __name__ == '__main__':
     unittest.main()
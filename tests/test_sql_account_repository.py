@@ -1,4 +1,5 @@
 import unittest
+from datetime import date
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from accounts.accounts import AccountData, PositionData, TransactionData, Base
@@ -50,6 +51,33 @@ class TestSQLAlchemyAccountRepository(unittest.TestCase):
         self.assertEqual(len(account_data["positions"]), 1)
         self.assertEqual(len(account_data["transactions"]), 1)
 
+    def test_bulk_create_transactions(self):
+        account = AccountData(account_number="123", additional_info={})
+        positions = [PositionData(account_number="123", position_type="type1", amount=100, additional_info={})]
+        self.repo.create_account(account, positions, [])
+        self.repo.batch_size = 2
+        positions = [PositionData(account_number="123", position_type="type1", amount=200, additional_info={}),
+                     PositionData(account_number="123", position_type="type2", amount=50, additional_info={})]
+        transactions = [TransactionData(account_number="123", transaction_type="type1", amount=i, additional_info={})
+                        for i in range(5)]
+        self.repo.bulk_create_transactions(positions, transactions)
+        account_data = self.repo.get_account_data("123")
+        amounts = {p.position_type: p.amount for p in account_data["positions"]}
+        self.assertEqual({"type1": 200, "type2": 50}, amounts)
+        self.assertEqual(5, len(account_data["transactions"]))
+
+    def test_iter_transactions(self):
+        account = AccountData(account_number="123", additional_info={})
+        transactions = [TransactionData(account_number="123", transaction_type="type1", amount=i,
+                                        value_date=date(2019, 1, 10 - i), additional_info={}) for i in range(5)]
+        self.repo.create_account(account, [], transactions)
+        value_dates = [t.value_date for t in self.repo.iter_transactions("123", batch_size=2)]
+        self.assertEqual([date(2019, 1, day) for day in range(6, 11)], value_dates)
+        value_dates = [t.value_date for t in self.repo.iter_transactions("123", from_value_date=date(2019, 1, 7),
+                                                                         to_value_date=date(2019, 1, 9))]
+        self.assertEqual([date(2019, 1, 7), date(2019, 1, 8), date(2019, 1, 9)], value_dates)
+        self.assertEqual([], list(self.repo.iter_transactions("456")))
+
     def test_get_account_data(self):
         account = AccountData(account_number="123", additional_info={})
         positions = [PositionData(account_number="123", position_type="type1", amount=100, additional_info={})]
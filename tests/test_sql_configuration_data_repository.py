@@ -52,5 +52,19 @@ class TestSQLAlchemyConfigurationRepository(unittest.TestCase):
         all_configs = self.repo.get_all_configurations()
         self.assertEqual(len(all_configs), 2)
 
+    def test_get_latest_configuration_per_engine(self):
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        self.addCleanup(session.close)
+        repo = SQLAlchemyConfigurationRepository(session)
+
+        self.repo.save(ConfigurationData(name="config1", label="Config 1", version=1, account_types=[]))
+        repo.save(ConfigurationData(name="config1", label="Other Config 1", version=1, account_types=[]))
+
+        self.assertIs(SQLAlchemyConfigurationRepository(self.Session()).cache, self.repo.cache)
+        self.assertEqual("Config 1", self.repo.get_latest_configuration("config1").label)
+        self.assertEqual("Other Config 1", repo.get_latest_configuration("config1").label)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file